@@ -14,4 +14,6 @@ from .sd_checks import *
 from .sd_ddf import *
 from .sd_load import *
 from .sd_log import *
+from .sd_metrics import *
+from .sd_trace import *
 from .sd_xds import *
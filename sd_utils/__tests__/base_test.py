@@ -10,6 +10,7 @@ December 14, 2017
 """
 
 import os
+import shutil
 import unittest
 
 import pandas
@@ -27,8 +28,14 @@ class BaseTestCase(unittest.TestCase):
 
         file_format_str = '__TESTING_FILE_1234.{extension}'
         self._temporary_parquet_file_path = file_format_str.format(extension='parquet')
+        self._temporary_csv_file_path = file_format_str.format(extension='csv')
+        self._temporary_dir_path = file_format_str.format(extension='dir')
 
     def tearDown(self):
-        if os.path.isfile(self._temporary_parquet_file_path):
-            print('Removing {}'.format(self._temporary_parquet_file_path))
-            os.remove(self._temporary_parquet_file_path)
+        for file_path in [self._temporary_parquet_file_path, self._temporary_csv_file_path]:
+            if os.path.isfile(file_path):
+                print('Removing {}'.format(file_path))
+                os.remove(file_path)
+        if os.path.isdir(self._temporary_dir_path):
+            print('Removing {}'.format(self._temporary_dir_path))
+            shutil.rmtree(self._temporary_dir_path)
@@ -0,0 +1,169 @@
+"""
+StratoDem Analytics : test_sd_cache
+Principal Author(s) : Michael Clawar
+Secondary Author(s) :
+Description :
+
+Notes :
+
+October 18, 2026
+"""
+
+import os
+import threading
+import time
+import unittest.mock
+
+import numpy as np
+import xarray
+
+from .base_test import BaseTestCase
+
+import sd_utils.sd_cache as sdc
+
+
+class TestSDCache(BaseTestCase):
+    def test_cache_unhashable_arguments(self):
+        calls = []
+
+        @sdc.cache
+        def col_sum(df, col):
+            calls.append(col)
+            return df[col].sum()
+
+        self.assertEqual(col_sum(self._df, 'COL_INT'), 10)
+        self.assertEqual(col_sum(self._df.copy(), 'COL_INT'), 10)
+        self.assertEqual(len(calls), 1)
+
+        df = self._df.copy()
+        df.loc[2, 'COL_INT'] = 100
+        self.assertEqual(col_sum(df, 'COL_INT'), 109)
+        self.assertEqual(len(calls), 2)
+
+        @sdc.cache(fast_hash=True)
+        def total(nd, xda):
+            calls.append('total')
+            return nd.sum() + float(xda.sum())
+
+        nd = np.arange(5)
+        xda = xarray.DataArray(np.ones(3), dims='x')
+        self.assertEqual(total(nd, xda), 13)
+        self.assertEqual(total(nd, xda), 13)
+        self.assertEqual(total(nd.copy(), xda), 13)
+        self.assertEqual(calls.count('total'), 2)
+        self.assertEqual(total.cache_info().hits, 1)
+
+    def test_cache_byte_budget(self):
+        @sdc.cache(max_bytes=3 * 8 * 1000)
+        def make_array(n):
+            return np.zeros(1000) + n
+
+        for n in range(5):
+            make_array(n)
+        info = make_array.cache_info()
+        self.assertEqual(info.currsize, 3)
+        self.assertEqual(info.evictions, 2)
+        self.assertLessEqual(info.nbytes, 3 * 8 * 1000)
+
+        make_array(4)
+        self.assertEqual(make_array.cache_info().hits, 1)
+        make_array(0)
+        self.assertEqual(make_array.cache_info().misses, 6)
+
+    def test_cache_single_flight_and_ttl(self):
+        calls = []
+
+        @sdc.cache(ttl=0.5)
+        def slow_square(n):
+            calls.append(n)
+            time.sleep(0.2)
+            return n ** 2
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(slow_square(3)))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, [9] * 4)
+        self.assertEqual(calls, [3])
+        info = slow_square.cache_info()
+        self.assertEqual((info.hits, info.misses), (3, 1))
+        self.assertGreater(info.time_saved, 0.5)
+
+        time.sleep(0.5)
+        self.assertEqual(slow_square(3), 9)
+        self.assertEqual(calls, [3, 3])
+
+    def test_disk_cache(self):
+        calls = []
+
+        @sdc.disk_cache(cache_dir=self._temporary_dir_path)
+        def make_df(n_rows, col='COL_INT'):
+            calls.append(n_rows)
+            return self._df.iloc[:n_rows][[col]]
+
+        @sdc.disk_cache(cache_dir=self._temporary_dir_path)
+        def make_list(n):
+            calls.append(n)
+            return list(range(n))
+
+        df = make_df(2)
+        self.assertTrue(make_df(2).equals(df))
+        self.assertTrue(make_df(2, col='COL_INT').equals(df))
+        self.assertEqual(make_list(3), [0, 1, 2])
+        self.assertEqual(make_list(3), [0, 1, 2])
+        self.assertEqual(calls, [2, 3])
+
+        make_df.cache_clear()
+        make_df(2)
+        self.assertEqual(calls, [2, 3, 2])
+
+        # An entry evicted between loading and touching it is a miss
+        with unittest.mock.patch.object(sdc.os, 'utime', side_effect=FileNotFoundError):
+            make_df(2)
+        self.assertEqual(calls, [2, 3, 2, 2])
+
+    def test_disk_cache_code_version(self):
+        @sdc.disk_cache(cache_dir=self._temporary_dir_path)
+        def make_value():
+            return 1
+
+        self.assertEqual(make_value(), 1)
+
+        # Same qualname, edited code
+        @sdc.disk_cache(cache_dir=self._temporary_dir_path)
+        def make_value():
+            return 2
+
+        self.assertEqual(make_value(), 2)
+
+        @sdc.disk_cache(cache_dir=self._temporary_dir_path, version=2)
+        def make_value():
+            return 3
+
+        self.assertEqual(make_value(), 3)
+
+    def test_disk_cache_eviction(self):
+        @sdc.disk_cache(cache_dir=self._temporary_dir_path, max_bytes=1)
+        def make_list(n):
+            return list(range(n))
+
+        make_list(1)
+        make_list(2)
+        entries = [f for _, _, files in os.walk(self._temporary_dir_path) for f in files]
+        self.assertEqual(len(entries), 0)
+
+        # Under the budget, the directory is only walked to learn its size once
+        @sdc.disk_cache(cache_dir=os.path.join(self._temporary_dir_path, 'large'),
+                        max_bytes=2 ** 30)
+        def make_range(n):
+            return list(range(n))
+
+        with unittest.mock.patch.object(
+                sdc, '_evict_disk_cache', wraps=sdc._evict_disk_cache) as evict:
+            for n in range(5):
+                make_range(n)
+        self.assertEqual(evict.call_count, 1)
@@ -0,0 +1,49 @@
+"""
+StratoDem Analytics : test_sd_checks
+Principal Author(s) : Michael Clawar
+Secondary Author(s) :
+Description :
+
+Notes :
+
+October 18, 2026
+"""
+
+import numpy as np
+
+from .base_test import BaseTestCase
+
+import sd_utils.sd_checks as sdc
+from sd_utils.sd_config import SDConfig
+
+
+class TestSDChecks(BaseTestCase):
+    def test_check_df_copy_modes(self):
+        df = sdc.check_df(self._df)
+        self.assertIsNot(df, self._df)
+        self.assertTrue(df.equals(self._df))
+
+        self.assertIs(sdc.check_df(self._df, copy='none'), self._df)
+
+        df = sdc.check_df(self._df, copy='view')
+        self.assertIsNot(df, self._df)
+        df['COL_NEW'] = 1
+        self.assertNotIn('COL_NEW', self._df.columns)
+
+        SDConfig.check_copy = 'none'
+        try:
+            self.assertIs(sdc.check_df(self._df), self._df)
+            self.assertIsNot(sdc.check_df(self._df, copy='deep'), self._df)
+        finally:
+            SDConfig.check_copy = 'deep'
+
+        with self.assertRaises(AssertionError):
+            sdc.check_df(self._df['COL_INT'], copy='none')
+
+    def test_check_ndarray_view_is_read_only(self):
+        nd = np.arange(4)
+        nd_view = sdc.check_ndarray(nd, copy='view')
+        self.assertTrue(np.shares_memory(nd, nd_view))
+        with self.assertRaises(ValueError):
+            nd_view[0] = 10
+        self.assertEqual(nd[0], 0)
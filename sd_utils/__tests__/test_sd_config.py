@@ -0,0 +1,62 @@
+"""
+StratoDem Analytics : test_sd_config
+Principal Author(s) : Michael Clawar
+Secondary Author(s) :
+Description :
+
+Notes :
+
+October 18, 2026
+"""
+
+import os
+import unittest.mock
+
+from .base_test import BaseTestCase
+
+from sd_utils import sd_config
+from sd_utils.sd_config import SDConfigClass
+
+
+class TestSDConfig(BaseTestCase):
+    def _write_cgroup_file(self, path: str, content: str) -> None:
+        path = os.path.join(self._temporary_dir_path, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content + '\n')
+
+    def test_detect_cgroup_v2(self):
+        os.makedirs(self._temporary_dir_path)
+        affinity_count = sd_config._detect_cpu_count(self._temporary_dir_path)
+
+        self._write_cgroup_file('cpu.max', 'max 100000')
+        self.assertEqual(sd_config._detect_cpu_count(self._temporary_dir_path), affinity_count)
+
+        self._write_cgroup_file('cpu.max', '50000 100000')
+        self.assertEqual(sd_config._detect_cpu_count(self._temporary_dir_path), 1)
+
+        self._write_cgroup_file('memory.max', str(2 ** 20))
+        self.assertEqual(sd_config._detect_memory_limit(self._temporary_dir_path), 2 ** 20)
+
+    def test_detect_cgroup_v1(self):
+        self._write_cgroup_file(os.path.join('cpu,cpuacct', 'cpu.cfs_quota_us'), '50000')
+        self._write_cgroup_file(os.path.join('cpu,cpuacct', 'cpu.cfs_period_us'), '100000')
+        self.assertEqual(sd_config._detect_cpu_count(self._temporary_dir_path), 1)
+
+        # No limit is reported as a huge number
+        self._write_cgroup_file(os.path.join('memory', 'memory.limit_in_bytes'), str(2 ** 63))
+        self.assertLess(sd_config._detect_memory_limit(self._temporary_dir_path), 2 ** 63)
+
+    def test_environment_overrides(self):
+        environ = {'SDUTILS_CPU_COUNT': '3', 'SDUTILS_MEMORY_LIMIT': '2G'}
+        with unittest.mock.patch.dict(os.environ, environ):
+            config = SDConfigClass()
+        self.assertEqual(config.cpu_count, 3)
+        self.assertEqual(config.npartitions, 3)
+        self.assertEqual(config.memory_limit, 2 * 2 ** 30)
+
+        with unittest.mock.patch.dict(os.environ, {'SDUTILS_NPARTITIONS': 'many'}):
+            with self.assertRaises(ValueError):
+                SDConfigClass()
+
+        self.assertEqual(SDConfigClass(cpu_count=5).cpu_count, 5)
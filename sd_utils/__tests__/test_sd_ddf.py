@@ -0,0 +1,154 @@
+"""
+StratoDem Analytics : test_sd_ddf
+Principal Author(s) : Michael Clawar
+Secondary Author(s) :
+Description :
+
+Notes :
+
+October 18, 2026
+"""
+
+import importlib.util
+import os
+import threading
+import unittest
+
+import dask
+import dask.dataframe
+import pandas
+
+from .base_test import BaseTestCase
+
+import sd_utils.sd_ddf as sdd
+from sd_utils.sd_config import SDConfig
+
+
+class TestSDDdf(BaseTestCase):
+    def _ddf_pipeline(self):
+        ddf = dask.dataframe.from_pandas(self._df, npartitions=2)
+        ddf['COL_INT'] = ddf['COL_INT'] * 2
+        return ddf[ddf['COL_FLOAT'] > 0]
+
+    def test_df_to_ddf_partition_bytes(self):
+        df = pandas.DataFrame({'KEY': range(1000, 0, -1), 'VALUE': 1.5})
+        nbytes = int(df.memory_usage(deep=True).sum())
+
+        npartitions = SDConfig.npartitions
+        SDConfig.npartitions = 2
+        try:
+            # Never fewer than SDConfig.npartitions, or than the rows of a short frame
+            self.assertEqual(sdd.df_to_ddf(df, partition_bytes=nbytes).npartitions, 2)
+            self.assertEqual(sdd.df_to_ddf(df.iloc[:1], partition_bytes=nbytes).npartitions, 1)
+            self.assertEqual(sdd.df_to_ddf(df, partition_bytes=nbytes // 4 + 1).npartitions, 4)
+        finally:
+            SDConfig.npartitions = npartitions
+        self.assertEqual(sdd.df_to_ddf(df, npartitions=3).npartitions, 3)
+
+        partition_bytes = SDConfig.partition_bytes
+        SDConfig.partition_bytes = None
+        try:
+            self.assertEqual(sdd.df_to_ddf(df).npartitions, SDConfig.npartitions)
+        finally:
+            SDConfig.partition_bytes = partition_bytes
+
+    def test_df_to_ddf_index(self):
+        df = pandas.DataFrame({'KEY': range(100, 0, -1), 'VALUE': range(100)})
+
+        ddf = sdd.df_to_ddf(df, npartitions=4, index='KEY')
+        self.assertTrue(ddf.known_divisions)
+        self.assertEqual(ddf.divisions[0], 1)
+        self.assertEqual(ddf.divisions[-1], 100)
+        self.assertEqual(ddf.loc[10].compute()['VALUE'].tolist(), [90])
+
+    def test_ddf_checkpoint(self):
+        ddf = self._ddf_pipeline()
+        df_expected = ddf.compute()
+
+        ddf_checkpoint = sdd.ddf_checkpoint(ddf, npartitions=3)
+        self.assertEqual(ddf_checkpoint.npartitions, 3)
+        self.assertTrue(ddf_checkpoint.compute().equals(df_expected))
+
+        ddf_checkpoint = sdd.ddf_checkpoint(ddf, mode='persist')
+        self.assertEqual(ddf_checkpoint.npartitions, 2)
+        self.assertLess(len(ddf_checkpoint.__dask_graph__()), len(ddf.__dask_graph__()))
+        self.assertTrue(ddf_checkpoint.compute().equals(df_expected))
+
+        ddf_checkpoint = sdd.ddf_checkpoint(ddf, mode='persist', npartitions=1)
+        self.assertEqual(ddf_checkpoint.npartitions, 1)
+        self.assertTrue(ddf_checkpoint.compute().equals(df_expected))
+
+    def test_ddf_checkpoint_parquet(self):
+        os.makedirs(self._temporary_dir_path)
+        ddf = self._ddf_pipeline()
+        df_expected = ddf.compute()
+
+        ddf_checkpoint = sdd.ddf_checkpoint(
+            ddf, mode='parquet', scratch_dir=self._temporary_dir_path, npartitions=1)
+        self.assertEqual(ddf_checkpoint.npartitions, 1)
+        self.assertEqual(len(os.listdir(self._temporary_dir_path)), 1)
+
+        df = ddf_checkpoint.compute()
+        self.assertEqual(list(df.index), list(df_expected.index))
+        for column in df_expected.columns:
+            self.assertEqual(list(df[column]), list(df_expected[column]))
+
+        ddf_other = sdd.ddf_checkpoint(
+            ddf, mode='parquet', scratch_dir=self._temporary_dir_path, npartitions=3)
+        self.assertEqual(ddf_other.npartitions, 3)
+        self.assertEqual(len(os.listdir(self._temporary_dir_path)), 2)
+
+        # Only the given checkpoint's files are removed
+        sdd.remove_checkpoint(ddf_checkpoint)
+        self.assertEqual(len(os.listdir(self._temporary_dir_path)), 1)
+        self.assertEqual(len(ddf_other.compute()), len(df_expected))
+        sdd.remove_checkpoint(ddf)
+
+        sdd._remove_checkpoint_dirs()
+        self.assertEqual(os.listdir(self._temporary_dir_path), [])
+
+    def test_dask_scheduler(self):
+        scheduler = dask.config.get('scheduler', None)
+        SDConfig.dask_scheduler = 'synchronous'
+        try:
+            with sdd.dask_scheduler():
+                self.assertEqual(dask.config.get('scheduler'), 'synchronous')
+                self.assertEqual(dask.config.get('num_workers'), SDConfig.cpu_count)
+
+            # Functions inside an explicit block keep its scheduler
+            with sdd.dask_scheduler('threads', workers=2):
+                with sdd._job_scheduler():
+                    self.assertEqual(dask.config.get('scheduler'), 'threads')
+                    self.assertEqual(dask.config.get('num_workers'), 2)
+
+                # Other threads don't see the block
+                depths = []
+                thread = threading.Thread(target=lambda: depths.append(sdd._scheduler_depth.get()))
+                thread.start()
+                thread.join()
+                self.assertEqual(depths, [0])
+            self.assertEqual(sdd._scheduler_depth.get(), 0)
+
+            ddf = self._ddf_pipeline()
+            self.assertTrue(sdd.ddf_checkpoint(ddf).compute().equals(ddf.compute()))
+        finally:
+            SDConfig.dask_scheduler = None
+        self.assertEqual(dask.config.get('scheduler', None), scheduler)
+
+    @unittest.skipUnless(importlib.util.find_spec('distributed'), 'distributed is not installed')
+    def test_dask_scheduler_distributed(self):
+        import distributed
+
+        ddf = self._ddf_pipeline()
+        try:
+            with sdd.dask_scheduler('distributed', workers=1, memory_limit='1GB'):
+                ddf_checkpoint = sdd.ddf_checkpoint(ddf, mode='persist')
+                # The partitions stay on the workers as futures
+                self.assertTrue(any(isinstance(task, distributed.Future)
+                                    for task in dict(ddf_checkpoint.__dask_graph__()).values()))
+                self.assertIs(distributed.get_client(), sdd._local_clients[(1, '1GB')])
+                self.assertTrue(ddf_checkpoint.compute().equals(ddf.compute()))
+            client = sdd._local_clients[(1, '1GB')]
+            self.assertEqual(len(client.scheduler_info()['workers']), 1)
+        finally:
+            sdd._close_local_clients()
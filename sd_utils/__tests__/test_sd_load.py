@@ -9,9 +9,31 @@ Notes :
 December 14, 2017
 """
 
+import importlib.util
+import os
+import subprocess
+import sys
+import unittest
+import unittest.mock
+
+import numpy as np
+import pandas
+import pandas.testing
+import pyarrow.parquet
+import xarray
+
 from .base_test import BaseTestCase
 
 import sd_utils.sd_load as sdl
+from sd_utils.sd_config import SDConfig
+
+
+def _transport_callback(df, file_path):
+    return df.assign(
+        COL_OBJECT=pandas.Series(['x', None] * (len(df) // 2), dtype=object, index=df.index),
+        COL_OBJECT_NAN=pandas.Series(['x', np.nan] * (len(df) // 2), dtype=object,
+                                     index=df.index),
+        COL_CAT=pandas.Categorical(df['COL_STR']))
 
 
 class TestSDLoad(BaseTestCase):
@@ -68,3 +90,328 @@ class TestSDLoad(BaseTestCase):
             _ = df['COL_INT']
         with self.assertRaises(KeyError):
             _ = df['COL_STR_2']
+
+    def test_csv_pyarrow_engine(self):
+        sdl.write_df_csv(self._df, self._temporary_csv_file_path)
+
+        def callback(df, file_path):
+            self.assertEqual(file_path, self._temporary_csv_file_path)
+            df['COL_INT'] = df['COL_INT'] * 2
+            return df
+
+        df = sdl.read_df_csv(self._temporary_csv_file_path, engine='pyarrow', callback=callback)
+        df_expected = sdl.read_df_csv(self._temporary_csv_file_path, callback=callback)
+        self.assertEqual(list(df.columns), list(self._df.columns))
+        self.assertTrue(df.equals(df_expected))
+
+        df = sdl.read_df_csv(self._temporary_csv_file_path, engine='pyarrow',
+                             usecols=['COL_STR', 'COL_INT'], dtype={'COL_INT': 'float64'})
+        self.assertEqual(list(df.columns), ['COL_STR', 'COL_INT'])
+        self.assertEqual(df['COL_INT'].dtype, 'float64')
+
+    def test_csv_pyarrow_engine_missing(self):
+        with open(self._temporary_csv_file_path, 'w') as f:
+            f.write('COL_STR,COL_INT,COL_FLOAT,COL_DATE,COL_CODE\n'
+                    'A,1,1.5,2020-01-01,x\n'
+                    ',2,,2020-01-02,-\n'
+                    'NA,,2.5,,y\n'
+                    'D,4,-,2020-01-04,z\n')
+
+        for kwargs in [{}, {'na_values': ['-']}, {'na_values': '-', 'keep_default_na': False},
+                       {'usecols': ['COL_STR', 'COL_DATE']}]:
+            df = sdl.read_df_csv(self._temporary_csv_file_path, engine='pyarrow', **kwargs)
+            df_expected = sdl.read_df_csv(self._temporary_csv_file_path, **kwargs)
+            pandas.testing.assert_frame_equal(df, df_expected)
+            # assert_frame_equal treats None and NaN alike
+            for column in df.columns:
+                self.assertEqual([type(v) for v in df[column]],
+                                 [type(v) for v in df_expected[column]], (column, kwargs))
+
+    def test_csv_chunk_iterator(self):
+        sdl.write_df_csv(self._df, self._temporary_csv_file_path)
+
+        def callback(df, file_path):
+            return df[df['COL_INT'] > 1]
+
+        df_list = list(sdl.iter_read_df_csv(
+            self._temporary_csv_file_path, callback=callback, chunk_bytes=30))
+        self.assertGreater(len(df_list), 1)
+
+        df = sdl.read_df_csv(self._temporary_csv_file_path, callback=callback)
+        self.assertTrue(pandas.concat(df_list, ignore_index=True).equals(
+            df.reset_index(drop=True)))
+
+    def test_csv_split_bytes(self):
+        sdl.write_df_csv(self._df, self._temporary_csv_file_path)
+
+        df = sdl.read_df_csv(self._temporary_csv_file_path, split_bytes=20)
+        self.assertTrue(df.equals(sdl.read_df_csv(self._temporary_csv_file_path)))
+
+        df = sdl.multi_read_df_csv(
+            [self._temporary_csv_file_path, self._temporary_csv_file_path], split_bytes=20,
+            usecols=['COL_STR', 'COL_FLOAT'])
+        self.assertEqual(list(df.columns), ['COL_STR', 'COL_FLOAT'])
+        self.assertEqual(len(df), 2 * len(self._df))
+        self.assertEqual(list(df['COL_STR']), 2 * list(self._df['COL_STR']))
+
+    def test_csv_split_bytes_dtypes(self):
+        # The first ranges only see numbers, later ones a code with letters and a float
+        df = pandas.DataFrame({
+            'CODE': ['00123', '00456', '00789', '01011', 'A1213'],
+            'VALUE': ['1', '2', '3', '4', '5.5'],
+            'FLAG': ['True', 'False', 'True', 'False', 'True']})
+        df.to_csv(self._temporary_csv_file_path, index=False)
+
+        df_expected = pandas.read_csv(self._temporary_csv_file_path)
+        df = sdl.read_df_csv(self._temporary_csv_file_path, split_bytes=20)
+        pandas.testing.assert_frame_equal(df, df_expected)
+        self.assertEqual(list(df['CODE']), list(df_expected['CODE']))
+        self.assertEqual(df['VALUE'].dtype, 'float64')
+
+    def test_multi_read_transport(self):
+        sdl.write_df_csv(self._df, self._temporary_csv_file_path)
+        paths = [self._temporary_csv_file_path] * 3
+
+        df_arrow = sdl.multi_read_df_csv(
+            paths, pool_size=2, executor='processes', callback=_transport_callback)
+        self.assertEqual(len(df_arrow), 3 * len(self._df))
+        self.assertEqual(list(df_arrow['COL_INT']), 3 * list(self._df['COL_INT']))
+
+        SDConfig.multi_read_transport = 'pickle'
+        try:
+            df_pickle = sdl.multi_read_df_csv(
+                paths, pool_size=2, executor='processes', callback=_transport_callback)
+        finally:
+            SDConfig.multi_read_transport = 'arrow'
+        pandas.testing.assert_frame_equal(df_arrow, df_pickle)
+        self.assertEqual(df_arrow['COL_OBJECT'].dtype, object)
+        # assert_frame_equal treats None and NaN alike
+        self.assertIsNone(df_arrow['COL_OBJECT'].iloc[1])
+        self.assertIsInstance(df_arrow['COL_OBJECT_NAN'].iloc[1], float)
+        self.assertEqual([type(v) for v in df_arrow['COL_OBJECT_NAN']],
+                         [type(v) for v in df_pickle['COL_OBJECT_NAN']])
+
+        # Columns aren't read-only views of the scratch files
+        self.assertTrue(all(block.values.flags.writeable for block in df_arrow._mgr.blocks
+                            if isinstance(block.values, np.ndarray)))
+        df_arrow.loc[0, 'COL_INT'] = 100
+        self.assertEqual(df_arrow['COL_INT'].iloc[0], 100)
+
+    def test_concat_df_list(self):
+        df_a = pandas.DataFrame({
+            'A': [1, 2], 'B': [1.5, 2.5], 'C': ['x', 'y'], 'D': [True, False],
+            'E': pandas.Categorical(['p', 'q'])})
+        df_b = pandas.DataFrame({
+            'A': [3.5], 'B': [3.5], 'C': ['z'], 'D': [1], 'E': pandas.Categorical(['p'])})
+        df_c = df_b.iloc[:0]
+
+        df_expected = pandas.concat([df_a, df_b, df_c], ignore_index=True)
+        df = sdl._concat_df_list([df_a, df_b, df_c])
+        self.assertTrue(df.equals(df_expected))
+        self.assertTrue(df.dtypes.equals(df_expected.dtypes))
+
+        # Mismatched columns fall back to pandas
+        df = sdl._concat_df_list([df_a, df_b[['B', 'A']]])
+        self.assertEqual(list(df.columns), ['A', 'B', 'C', 'D', 'E'])
+        self.assertEqual(len(df), 3)
+
+        # A single part isn't modified
+        df = sdl._concat_df_list([self._df])
+        self.assertEqual(list(df.index), [0, 1, 2, 3])
+        self.assertEqual(list(self._df.index), [2, 3, 4, 5])
+
+    @unittest.skipUnless(sys.platform.startswith('linux'), 'Needs ru_maxrss in KiB')
+    def test_concat_df_list_peak_memory(self):
+        # Growth of the peak resident memory of a fresh process over concatenating 128 MiB of
+        # parts, with freed arrays returned to the OS right away
+        script = '''if True:
+            import resource, sys
+            import numpy as np, pandas
+            import sd_utils.sd_load as sdl
+            parts = [pandas.DataFrame({'A': np.arange(2 ** 20, dtype=float),
+                                       'B': np.arange(2 ** 20)}) for _ in range(8)]
+            before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            if sys.argv[1] == 'sd_utils':
+                df = sdl._concat_df_list(parts)
+            else:
+                df = pandas.concat(parts, ignore_index=True)
+            print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before)
+        '''
+        env = dict(os.environ, MALLOC_MMAP_THRESHOLD_='131072', PYTHONPATH=os.pathsep.join(
+            [os.path.dirname(os.path.dirname(sdl.__file__))] + sys.path))
+        growth = {
+            method: int(subprocess.run(
+                [sys.executable, '-c', script, method], env=env, check=True,
+                stdout=subprocess.PIPE, universal_newlines=True).stdout.split()[-1])
+            for method in ['sd_utils', 'pandas']}
+        print('Peak RSS growth (KiB): {}'.format(growth))
+        self.assertGreater(growth['pandas'], 100 * 2 ** 10)
+        self.assertLess(growth['sd_utils'], growth['pandas'] / 2)
+
+    def test_multi_read_executors(self):
+        sdl.write_df_csv(self._df, self._temporary_csv_file_path)
+        paths = [self._temporary_csv_file_path] * 3
+
+        # Small files are read serially
+        self.assertEqual(sdl._choose_executor(paths, sdl.read_df_csv, pool_size=2), 'serial')
+
+        df_expected = sdl.multi_read_df_csv(paths)
+        for executor in ['threads', 'processes']:
+            SDConfig.persistent_pool = True
+            try:
+                df = sdl.multi_read_df_csv(paths, pool_size=2, executor=executor)
+                self.assertTrue(df.equals(df_expected))
+                self.assertEqual(len(sdl._process_pools) + len(sdl._thread_pools), 1)
+                df = sdl.multi_read_df_csv(paths, pool_size=2, executor=executor)
+                self.assertTrue(df.equals(df_expected))
+                self.assertEqual(len(sdl._process_pools) + len(sdl._thread_pools), 1)
+            finally:
+                SDConfig.persistent_pool = False
+                sdl.shutdown_worker_pools()
+
+    def test_parquet_pushdown(self):
+        self._df.to_parquet(self._temporary_parquet_file_path, index=False, row_group_size=2)
+
+        df = sdl.read_df_parquet(
+            self._temporary_parquet_file_path, filters=[('COL_INT', '>', 2)])
+        self.assertEqual(list(df['COL_INT']), [3, 4])
+
+        df = sdl.read_df_parquet(self._temporary_parquet_file_path, row_groups=[1],
+                                 columns=['COL_STR'], memory_map=True)
+        self.assertEqual(list(df['COL_STR']), ['C', 'D'])
+
+        # pyarrow kwargs go to the ParquetFile or read_row_groups taking them
+        df = sdl.read_df_parquet(self._temporary_parquet_file_path, row_groups=[1],
+                                 buffer_size=1024, use_pandas_metadata=True)
+        self.assertEqual(list(df['COL_INT']), [3, 4])
+        with self.assertRaises(AssertionError):
+            sdl.read_df_parquet(self._temporary_parquet_file_path, row_groups=[1],
+                                partitioning='hive')
+
+        df = sdl.read_df_parquet(self._temporary_parquet_file_path, categories=['COL_STR_2'])
+        self.assertEqual(df['COL_STR_2'].dtype.name, 'category')
+        self.assertEqual(list(df['COL_STR_2']), list(self._df['COL_STR_2']))
+
+    def test_parquet_write_partitioned(self):
+        df = self._df.assign(COL_PART=['X', 'Y', 'X', 'Y'])
+        sdl.write_df_parquet(df, self._temporary_dir_path, partition_cols=['COL_PART'],
+                             row_group_bytes=100, version='1.0', index=False)
+
+        self.assertTrue(os.path.isfile(os.path.join(self._temporary_dir_path, '_metadata')))
+        self.assertTrue(os.path.isfile(
+            os.path.join(self._temporary_dir_path, 'COL_PART=X', 'part-0.parquet')))
+        metadata = pyarrow.parquet.read_metadata(
+            os.path.join(self._temporary_dir_path, '_metadata'))
+        self.assertEqual(metadata.num_rows, len(df))
+
+        df_read = sdl.read_df_parquet(self._temporary_dir_path, filters=[('COL_PART', '=', 'X')])
+        self.assertEqual(sorted(df_read['COL_STR']), ['A', 'C'])
+
+        ddf = sdl.read_ddf_parquet(self._temporary_dir_path)
+        self.assertEqual(len(ddf.compute()), len(df))
+
+        # Values are escaped like pyarrow.dataset does, kwargs reach pyarrow and an earlier
+        # write doesn't leave partitions behind
+        df = self._df.assign(COL_PART=['a/b', 'c=d', '50%', 'a/b'])
+        with self.assertRaises(FileExistsError):
+            sdl.write_df_parquet(df, self._temporary_dir_path, partition_cols=['COL_PART'])
+        with open(os.path.join(self._temporary_dir_path, 'notes.txt'), 'w') as f:
+            f.write('Not part of the dataset')
+        sdl.write_df_parquet(df, self._temporary_dir_path, partition_cols=['COL_PART'],
+                             version='1.0', index=False, compression='gzip', overwrite=True)
+        self.assertTrue(os.path.isfile(os.path.join(self._temporary_dir_path, 'notes.txt')))
+        os.remove(os.path.join(self._temporary_dir_path, 'notes.txt'))
+        self.assertEqual(
+            sorted(p for p in os.listdir(self._temporary_dir_path) if not p.startswith('_')),
+            ['COL_PART=50%25', 'COL_PART=a%2Fb', 'COL_PART=c%3Dd'])
+        metadata = pyarrow.parquet.read_metadata(os.path.join(
+            self._temporary_dir_path, 'COL_PART=a%2Fb', 'part-0.parquet'))
+        self.assertEqual(metadata.row_group(0).column(0).compression, 'GZIP')
+
+        df_read = sdl.read_df_parquet(self._temporary_dir_path)
+        self.assertEqual(sorted(df_read['COL_PART'].astype(str)), sorted(df['COL_PART']))
+
+    def test_parquet_write_partitioned_refuses_directory(self):
+        # A directory which isn't a dataset is left alone
+        os.makedirs(os.path.join(self._temporary_dir_path, 'data'))
+        with self.assertRaises(FileExistsError):
+            sdl.write_df_parquet(self._df, self._temporary_dir_path, partition_cols=['COL_STR'],
+                                 version='1.0')
+        self.assertEqual(os.listdir(self._temporary_dir_path), ['data'])
+
+    def test_read_cache(self):
+        sdl.write_df_csv(self._df, self._temporary_csv_file_path)
+        sdl.clear_read_cache()
+
+        df = sdl.read_df_csv(self._temporary_csv_file_path, read_cache=True)
+        df_cached = sdl.read_df_csv(self._temporary_csv_file_path, read_cache=True)
+        self.assertTrue(df_cached.equals(df))
+        self.assertIsNot(df_cached, df)
+        self.assertEqual(sdl.read_cache_info().hits, 1)
+
+        df_read_only = sdl.read_df_csv(
+            self._temporary_csv_file_path, read_cache=True, read_only=True)
+        self.assertIs(df_read_only, sdl.read_df_csv(
+            self._temporary_csv_file_path, read_cache=True, read_only=True))
+
+        # Other arguments are read separately
+        df = sdl.read_df_csv(self._temporary_csv_file_path, read_cache=True, usecols=['COL_STR'])
+        self.assertEqual(list(df.columns), ['COL_STR'])
+
+        # Changing the file invalidates the cache
+        sdl.write_df_csv(self._df.iloc[:2], self._temporary_csv_file_path)
+        os.utime(self._temporary_csv_file_path, ns=(0, 10 ** 9))
+        df = sdl.read_df_csv(self._temporary_csv_file_path, read_cache=True)
+        self.assertEqual(len(df), 2)
+        sdl.clear_read_cache()
+
+    def _xds_year(self, year: int) -> xarray.Dataset:
+        return xarray.Dataset(
+            {'POP': (('YEAR', 'G5'), np.arange(4.).reshape(1, 4) + year),
+             'NAME': ('G5', np.array(['A', 'B', 'C', 'D']))},
+            coords={'YEAR': [year], 'G5': [101, 102, 103, 104]})
+
+    @unittest.skipUnless(importlib.util.find_spec('netCDF4'), 'netCDF4 is not installed')
+    def test_netcdf_chunked_compressed(self):
+        file_paths = [os.path.join(self._temporary_dir_path, '{}.nc'.format(year))
+                      for year in [2020, 2021]]
+        os.makedirs(self._temporary_dir_path)
+        for year, file_path in zip([2020, 2021], file_paths):
+            sdl.write_xds_netcdf(self._xds_year(year), file_path, complevel=4, chunks={'G5': 2})
+
+        xds = sdl.read_xds_netcdf(file_paths[0], chunks={'G5': 2})
+        self.assertEqual(xds['POP'].chunks, ((1,), (2, 2)))
+        self.assertEqual(xds['POP'].encoding['complevel'], 4)
+        self.assertEqual(xds['POP'].encoding['chunksizes'], (1, 2))
+        self.assertTrue(xds.compute().identical(self._xds_year(2020)))
+        xds.close()
+
+        xds = sdl.read_xds_mfnetcdf(file_paths, 'YEAR', data_vars='minimal')
+        self.assertEqual(xds['POP'].chunks[0], (1, 1))
+        self.assertTrue(xds.compute().identical(
+            xarray.concat([self._xds_year(2020), self._xds_year(2021)], dim='YEAR',
+                          data_vars='minimal')))
+        xds.close()
+
+    @unittest.skipUnless(importlib.util.find_spec('zarr'), 'zarr is not installed')
+    def test_zarr_write_read(self):
+        xds_expected = self._xds_year(2020)
+        sdl.write_xds_zarr(xds_expected, self._temporary_dir_path, chunks={'G5': 3})
+
+        xds = sdl.read_xds_zarr(self._temporary_dir_path, chunks={})
+        self.assertEqual(xds['POP'].chunks, ((1,), (3, 1)))
+        self.assertTrue(xds.compute().identical(xds_expected))
+
+    def test_pool_size_default(self):
+        sdl.write_df_csv(self._df, self._temporary_csv_file_path)
+        paths = [self._temporary_csv_file_path] * 3
+
+        # The default pool size is read from SDConfig when called
+        cpu_count = SDConfig.cpu_count
+        SDConfig.cpu_count = 1
+        try:
+            with unittest.mock.patch.object(sdl, '_pool_map', wraps=sdl._pool_map) as pool_map:
+                sdl.multi_read_df_csv(paths, executor='threads')
+        finally:
+            SDConfig.cpu_count = cpu_count
+        self.assertEqual(pool_map.call_args[1]['pool_size'], 1)
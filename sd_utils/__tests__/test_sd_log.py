@@ -9,8 +9,154 @@ Notes :
 January 13, 2018
 """
 
+import asyncio
+import contextlib
+import http.server
+import inspect
+import io
+import json
+import threading
 import time
+import unittest.mock
+from typing import List
 
 from .base_test import BaseTestCase
 
+from sd_utils import sd_log
+from sd_utils.sd_config import SDConfig
 from sd_utils.sd_log import SDLog
+
+
+class _RecordingLog(SDLog):
+    messages = []  # type: List[str]
+
+    @classmethod
+    def log_message(cls, message: str, **kwargs) -> None:
+        cls.messages.append(message)
+
+
+class _StubSlackHandler(http.server.BaseHTTPRequestHandler):
+    """Slack Web API stub recording the messages posted, failing the first request"""
+    requests = []  # type: List[dict]
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.requests.append(dict(path=self.path, body=json.loads(body)))
+
+        status = 500 if len(self.requests) == 1 else 200
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps({'ok': status == 200}).encode())
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestSDLog(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        _RecordingLog.messages = []
+
+    def test_contexts_per_thread(self):
+        @_RecordingLog.log_func
+        def inner(barrier: threading.Barrier) -> int:
+            barrier.wait()
+            _RecordingLog.quick_log('inner')
+            return len(_RecordingLog.current_contexts())
+
+        depths = []
+
+        @_RecordingLog.log_func
+        def outer(barrier: threading.Barrier) -> None:
+            depths.append(inner(barrier))
+
+        barrier = threading.Barrier(4)
+        threads = [threading.Thread(target=outer, args=(barrier,)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(depths, [2] * 4)
+        self.assertEqual(len(SDLog.current_contexts()), 0)
+        self.assertTrue(all(m.startswith('--[ inner') for m in _RecordingLog.messages
+                            if 'inner ]' in m))
+
+    def test_contexts_deprecated(self):
+        with SDLog('outer') as sdlog:
+            with self.assertWarns(DeprecationWarning):
+                contexts = SDLog.contexts
+            self.assertEqual(contexts, [sdlog])
+        with self.assertWarns(DeprecationWarning):
+            self.assertEqual(SDLog.contexts, [])
+        with self.assertRaises(AttributeError):
+            sdlog.contexts = []
+
+    def test_log_func_async(self):
+        @_RecordingLog.log_func(max_expected_time=10)
+        async def fetch(delay: float) -> int:
+            await asyncio.sleep(delay)
+            return len(_RecordingLog.current_contexts())
+
+        async def main() -> List[int]:
+            with _RecordingLog('main'):
+                return await asyncio.gather(fetch(.02), fetch(.01))
+
+        start = time.time()
+        self.assertEqual(asyncio.run(main()), [2, 2])
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(len(SDLog.current_contexts()), 0)
+        self.assertEqual([m.split(' [')[0] for m in _RecordingLog.messages if 'End' in m],
+                         ['-End : TestSDLog.test_log_func_async.<locals>.fetch'] * 2 +
+                         ['End : main'])
+
+        self.assertTrue(inspect.iscoroutinefunction(fetch))
+        self.assertEqual(asyncio.run(fetch(0, sdlog=False)), 0)
+
+    def test_log_async(self):
+        stdout = io.StringIO()
+        SDConfig.log_async = True
+        try:
+            with contextlib.redirect_stdout(stdout):
+                with SDLog('async logging', timer=False):
+                    SDLog.quick_log('message')
+                self.assertTrue(sd_log.flush_logs(timeout=10))
+        finally:
+            SDConfig.log_async = False
+
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual(lines[0], 'Start : async logging')
+        self.assertTrue(lines[1].startswith('-[ message ]'))
+        self.assertEqual(lines[2], 'End : async logging')
+
+    def test_slack_notification(self):
+        _StubSlackHandler.requests = []
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _StubSlackHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        config = dict(slack_api_token=SDConfig.slack_api_token,
+                      slack_channel=SDConfig.slack_channel,
+                      slack_personal_prefix=SDConfig.slack_personal_prefix,
+                      slack_base_url=SDConfig.slack_base_url)
+        SDConfig.slack_api_token = 'xoxb-test'
+        SDConfig.slack_channel = 'pipeline'
+        SDConfig.slack_personal_prefix = '<@user>'
+        SDConfig.slack_base_url = 'http://127.0.0.1:{}/'.format(server.server_address[1])
+        try:
+            with unittest.mock.patch.object(sd_log, '_SLACK_RETRY_DELAY', .01):
+                with _RecordingLog('slack job', slack=True):
+                    pass
+                self.assertTrue(sd_log.flush_logs(timeout=10))
+        finally:
+            for name, value in config.items():
+                setattr(SDConfig, '_' + name, value)
+            server.shutdown()
+            server.server_close()
+
+        # The first post failed and was retried
+        self.assertEqual(len(_StubSlackHandler.requests), 2)
+        request = _StubSlackHandler.requests[-1]
+        self.assertEqual(request['path'], '/chat.postMessage')
+        self.assertEqual(request['body']['channel'], '#pipeline')
+        self.assertTrue(request['body']['text'].startswith('<@user> *FINISHED* `slack job`'))
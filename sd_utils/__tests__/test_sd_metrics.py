@@ -0,0 +1,97 @@
+"""
+StratoDem Analytics : test_sd_metrics
+Principal Author(s) : Michael Clawar
+Secondary Author(s) :
+Description :
+
+Notes :
+
+October 18, 2026
+"""
+
+import json
+import time
+import tracemalloc
+
+from .base_test import BaseTestCase
+
+from sd_utils import sd_metrics
+from sd_utils.sd_config import SDConfig
+from sd_utils.sd_log import SDLog, log_func
+
+
+_SLEEP = '{}._sleep'.format(__name__)
+
+
+@log_func
+def _sleep(seconds: float) -> None:
+    time.sleep(seconds)
+
+
+@log_func
+def _allocate() -> list:
+    return [0] * 10 ** 6
+
+
+class TestSDMetrics(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        sd_metrics.reset_metrics()
+
+    def test_record_durations(self):
+        for seconds in [.01, .02, .03]:
+            _sleep(seconds)
+        with self.assertRaises(ValueError):
+            with SDLog('failing block 1', metric_name='failing "block"'):
+                raise ValueError
+        # Messages without a metric_name aren't recorded
+        with SDLog('unnamed block'):
+            pass
+
+        metrics = sd_metrics.get_metrics()
+        self.assertEqual(sorted(metrics), sorted([_SLEEP, 'failing "block"']))
+        self.assertEqual(metrics[_SLEEP]['count'], 3)
+        self.assertEqual(metrics[_SLEEP]['errors'], 0)
+        self.assertGreaterEqual(metrics[_SLEEP]['total_seconds'], .06)
+        self.assertGreaterEqual(metrics[_SLEEP]['p50_seconds'], .02)
+        self.assertEqual(metrics[_SLEEP]['p99_seconds'], metrics[_SLEEP]['max_seconds'])
+        self.assertEqual(metrics['failing "block"']['errors'], 1)
+
+        self.assertEqual(json.loads(sd_metrics.metrics_json()), metrics)
+
+        prometheus = sd_metrics.metrics_prometheus()
+        self.assertIn('# TYPE sd_utils_duration_seconds summary', prometheus)
+        self.assertIn('sd_utils_duration_seconds_count{{name="{}"}} 3'.format(_SLEEP),
+                      prometheus)
+        self.assertIn('sd_utils_errors_total{name="failing \\"block\\""} 1', prometheus)
+
+        SDConfig.metrics = False
+        try:
+            _sleep(0)
+        finally:
+            SDConfig.metrics = True
+        self.assertEqual(sd_metrics.get_metrics()[_SLEEP]['count'], 3)
+
+    def test_same_qualname(self):
+        # Functions of the same name in different modules are recorded separately
+        def other_sleep(seconds: float) -> None:
+            time.sleep(seconds)
+
+        other_sleep.__module__, other_sleep.__qualname__ = 'other_module', '_sleep'
+        log_func(other_sleep)(0)
+        _sleep(0)
+
+        metrics = sd_metrics.get_metrics()
+        self.assertEqual(sorted(metrics), sorted([_SLEEP, 'other_module._sleep']))
+        self.assertEqual(metrics[_SLEEP]['count'], 1)
+
+    def test_record_allocations(self):
+        tracemalloc.start()
+        try:
+            result = _allocate()
+        finally:
+            tracemalloc.stop()
+
+        metrics = sd_metrics.get_metrics()['{}._allocate'.format(__name__)]
+        self.assertGreaterEqual(metrics['alloc_delta_bytes'], 8 * len(result))
+        self.assertIsNotNone(sd_metrics._rss_bytes())
@@ -0,0 +1,107 @@
+"""
+StratoDem Analytics : test_sd_trace
+Principal Author(s) : Michael Clawar
+Secondary Author(s) :
+Description :
+
+Notes :
+
+October 18, 2026
+"""
+
+import asyncio
+import json
+import os
+import threading
+
+from .base_test import BaseTestCase
+
+import sd_utils.sd_load as sdl
+from sd_utils import sd_trace
+from sd_utils.sd_log import SDLog
+
+
+class TestSDTrace(BaseTestCase):
+    def test_trace_nested_contexts(self):
+        trace_path = self._temporary_dir_path + '.json'
+        try:
+            with sd_trace.tracing(trace_path):
+                with SDLog('outer'):
+                    with SDLog('inner'):
+                        pass
+                thread = threading.Thread(target=lambda: SDLog('in thread').__enter__().__exit__(
+                    None, None, None), name='worker-thread')
+                thread.start()
+                thread.join()
+
+            with open(trace_path) as f:
+                events = json.load(f)['traceEvents']
+        finally:
+            if os.path.isfile(trace_path):
+                os.remove(trace_path)
+
+        spans = {e['name']: e for e in events if e['ph'] == 'X'}
+        self.assertEqual(sorted(spans), ['in thread', 'inner', 'outer'])
+        self.assertTrue(_contains(spans['outer'], spans['inner']))
+        self.assertTrue(all(e['pid'] == os.getpid() for e in events))
+        self.assertEqual(len({e['tid'] for e in events}), 2)
+        self.assertIn('worker-thread', [e['args']['name'] for e in events if e['ph'] == 'M'])
+
+        # Nothing is recorded outside tracing
+        with SDLog('untraced'):
+            pass
+        self.assertNotIn('untraced', [e['name'] for e in sd_trace.trace_events()])
+
+    def test_trace_async_contexts(self):
+        async def fetch(name: str, delay: float) -> None:
+            with SDLog(name):
+                await asyncio.sleep(delay)
+
+        async def main() -> None:
+            # The spans overlap on one thread without nesting
+            await asyncio.gather(fetch('slow', .05), fetch('fast', .01))
+
+        with sd_trace.tracing():
+            asyncio.run(main())
+        spans = {e['name']: e for e in sd_trace.stop_tracing() if e['ph'] == 'X'}
+
+        self.assertEqual(spans['slow']['tid'], spans['fast']['tid'])
+        self.assertGreaterEqual(spans['slow']['dur'], 50000)
+        self.assertGreaterEqual(spans['fast']['dur'], 10000)
+        self.assertLess(spans['fast']['dur'], spans['slow']['dur'])
+
+    def test_trace_worker_processes(self):
+        sdl.write_df_csv(self._df, self._temporary_csv_file_path)
+        paths = [self._temporary_csv_file_path] * 3
+
+        with sd_trace.tracing():
+            df = sdl.multi_read_df_csv(paths, pool_size=2, executor='processes')
+        events = sd_trace.stop_tracing()
+        self.assertEqual(len(df), 3 * len(self._df))
+
+        worker_spans = [e for e in events if e['ph'] == 'X' and e['pid'] != os.getpid()]
+        self.assertEqual([e['name'] for e in worker_spans], ['read_df_csv'] * 3)
+        parent_span, = [e for e in events if e['name'] == 'multi_read_df_csv']
+        self.assertTrue(all(_contains(parent_span, e) for e in worker_spans))
+
+        # Including the joblib reader
+        with sd_trace.tracing():
+            sdl.multi_joblib_read_df_csv(paths, [{}] * 3, pool_size=2)
+        events = sd_trace.stop_tracing()
+        self.assertEqual(
+            [e['name'] for e in events if e['ph'] == 'X' and e['pid'] != os.getpid()],
+            ['read_df_csv'] * 3)
+
+        # A single joblib worker runs in this process, which keeps tracing
+        with sd_trace.tracing():
+            with SDLog('outer'):
+                sdl.multi_joblib_read_df_csv(paths, [{}] * 3, pool_size=1)
+                self.assertTrue(sd_trace.is_tracing())
+        spans = {e['name']: e for e in sd_trace.stop_tracing() if e['ph'] == 'X'}
+        self.assertEqual(sorted(spans), ['multi_joblib_read_df_csv', 'outer', 'read_df_csv'])
+        self.assertTrue(_contains(spans['outer'], spans['multi_joblib_read_df_csv']))
+
+
+def _contains(outer: dict, inner: dict) -> bool:
+    return outer['ts'] <= inner['ts'] and \
+        inner['ts'] + inner['dur'] <= outer['ts'] + outer['dur']
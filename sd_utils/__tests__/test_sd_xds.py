@@ -0,0 +1,180 @@
+"""
+StratoDem Analytics : test_sd_xds
+Principal Author(s) : Michael Clawar
+Secondary Author(s) :
+Description :
+
+Notes :
+
+October 18, 2026
+"""
+
+import importlib.util
+import unittest
+
+import numpy as np
+import pandas
+import xarray
+
+from .base_test import BaseTestCase
+
+import sd_utils.sd_xds as sdx
+
+
+class TestSDXds(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self._xda_reference = xarray.DataArray(
+            np.array([101, 102, 103, 104]), dims='G5', name='G5')
+
+    def test_make_gather_map(self):
+        gather_map = sdx.make_gather_map(self._xda_reference, [104, 101, 101])
+        self.assertEqual(gather_map.dtype, np.intp)
+        self.assertEqual(list(gather_map), [3, 0, 0])
+
+        gather_map = sdx.make_gather_map(
+            self._xda_reference, xarray.DataArray(np.array([102, 103]), dims='G5_TO'))
+        self.assertEqual(list(gather_map), [1, 2])
+
+        with self.assertRaises(KeyError):
+            sdx.make_gather_map(self._xda_reference, [101, 999])
+        with self.assertRaises(TypeError):
+            sdx.make_gather_map(self._xda_reference, (101, 102))
+
+    def test_make_gather_map_missing(self):
+        gather_map = sdx.make_gather_map(
+            self._xda_reference, np.array([101, 999]), missing='sentinel')
+        self.assertEqual(list(gather_map), [0, -1])
+
+        gather_map = sdx.make_gather_map(
+            self._xda_reference, np.array([101, 999]), missing='mask')
+        self.assertEqual(list(gather_map.mask), [False, True])
+        self.assertEqual(gather_map[0], 0)
+
+    def test_make_gather_map_cache(self):
+        keys = set(sdx._reference_index_cache)
+        xda_reference = xarray.DataArray(np.array([201, 202, 203]), dims='G5')
+        self.assertEqual(list(sdx.make_gather_map(xda_reference, [203])), [2])
+
+        # Modifying the reference in place isn't answered from the cache
+        xda_reference.values[0] = 203
+        xda_reference.values[2] = 201
+        self.assertEqual(list(sdx.make_gather_map(xda_reference, [203])), [0])
+
+        # Entries don't outlive the reference
+        self.assertGreater(len(set(sdx._reference_index_cache) - keys), 0)
+        del xda_reference
+        self.assertEqual(set(sdx._reference_index_cache) - keys, set())
+
+    def test_make_gather_map_duplicates(self):
+        xda_reference = xarray.DataArray(np.array(['A', 'B', 'A']), dims='G')
+        self.assertEqual(list(sdx.make_gather_map(xda_reference, ['A', 'B'])), [2, 1])
+
+    def test_gather_map_operator(self):
+        xds = xarray.Dataset(
+            {'POP': (('YEAR', 'G5'), np.arange(8).reshape(2, 4)),
+             'AREA': ('G5', np.array([1., 2., 3., 4.])),
+             'CONST': ('YEAR', np.array([5, 6]))},
+            coords={'G5': self._xda_reference.values, 'YEAR': [2020, 2021]})
+        gather_map = sdx.GatherMap(
+            xds['G5'], xarray.DataArray(np.array([103, 101, 103]), dims='G3'))
+
+        xds_gathered = gather_map.gather(xds)
+        self.assertEqual(xds_gathered['POP'].dims, ('YEAR', 'G3'))
+        self.assertEqual(xds_gathered['POP'].values.tolist(), [[2, 0, 2], [6, 4, 6]])
+        self.assertEqual(xds_gathered['AREA'].values.tolist(), [3., 1., 3.])
+        self.assertEqual(xds_gathered['CONST'].values.tolist(), [5, 6])
+
+        xds_scattered = gather_map.scatter_add(xds_gathered)
+        self.assertEqual(xds_scattered['POP'].dims, ('YEAR', 'G5'))
+        self.assertEqual(xds_scattered['POP'].values.tolist(), [[0, 0, 4, 0], [4, 0, 12, 0]])
+        self.assertEqual(xds_scattered['POP'].dtype, xds['POP'].dtype)
+        self.assertEqual(xds_scattered['AREA'].values.tolist(), [1., 0., 6., 0.])
+        self.assertEqual(list(xds_scattered['G5'].values), list(self._xda_reference.values))
+
+        # dask-backed objects give the same results
+        xds_chunked = xds.chunk({'YEAR': 1})
+        self.assertTrue(gather_map.gather(xds_chunked).compute().identical(xds_gathered))
+        self.assertTrue(gather_map.scatter_add(xds_gathered.chunk({'YEAR': 1})).compute()
+                        .identical(xds_scattered))
+
+    def test_gather_map_operator_same_dim(self):
+        # Without target_dim, gathered values stay along the reference dimension
+        xda = xarray.DataArray(np.array([1, 2, 3, 4]), dims='G5',
+                               coords={'G5': self._xda_reference.values})
+        gather_map = sdx.GatherMap(xda['G5'], [101, 101, 102, 104, 104])
+
+        xda_gathered = gather_map.gather(xda)
+        self.assertEqual(xda_gathered.dims, ('G5',))
+        self.assertEqual(xda_gathered.values.tolist(), [1, 1, 2, 4, 4])
+
+        xda_scattered = gather_map.scatter_add(xda_gathered)
+        self.assertEqual(xda_scattered.values.tolist(), [2, 2, 0, 8])
+        self.assertEqual(list(xda_scattered['G5'].values), list(self._xda_reference.values))
+        self.assertTrue(gather_map.scatter_add(xda_gathered.chunk({'G5': 2})).compute()
+                        .identical(xda_scattered))
+        self.assertEqual(gather_map.scatter_add(xda_gathered.to_dataset(name='POP'))['POP']
+                         .values.tolist(), [2, 2, 0, 8])
+
+    def test_gather_map_operator_int64(self):
+        # Integers are summed exactly, beyond what float64 represents
+        gather_map = sdx.GatherMap(self._xda_reference, [101, 101, 102], target_dim='G3')
+        xda = xarray.DataArray(np.array([2 ** 53 + 1, 2 ** 53 + 1, 1]), dims='G3')
+        self.assertEqual(gather_map.scatter_add(xda).values.tolist(), [2 ** 54 + 2, 1, 0, 0])
+
+    def test_gather_map_operator_missing(self):
+        xda = xarray.DataArray(np.array([1., 2., 3., 4.]), dims='G5',
+                               coords={'G5': self._xda_reference.values})
+        gather_map = sdx.GatherMap(xda['G5'], [104, 999], target_dim='G3', missing='ignore')
+
+        xda_gathered = gather_map.gather(xda)
+        self.assertEqual(xda_gathered.values[0], 4.)
+        self.assertTrue(np.isnan(xda_gathered.values[1]))
+        self.assertEqual(gather_map.scatter_add(xda_gathered).values.tolist(), [0., 0., 0., 4.])
+
+    def _sparse_df(self):
+        return pandas.DataFrame({
+            'G5': [104, 101, 102, 104, 103],
+            'YEAR': [2020, 2020, 2021, 2021, 2022],
+            'POP': [4, 1, 2, 8, 3],
+            'RATE': [.4, .1, .2, .8, .3],
+            'FLAG': [True, False, True, True, False]}).set_index(['G5', 'YEAR'])
+
+    def test_df_to_xds_chunks(self):
+        df = self._sparse_df()
+        xds_expected = xarray.Dataset.from_dataframe(df)
+
+        xds = sdx.df_to_xds(df, chunks=3)
+        self.assertEqual(xds['POP'].chunks, ((3, 1), (3,)))
+        self.assertTrue(xds.compute().identical(xds_expected))
+
+        xda = sdx.ds_to_xda(df['RATE'], chunks=1)
+        self.assertTrue(xda.compute().identical(xarray.DataArray.from_series(df['RATE'])))
+
+        # Complete frames keep their dtypes
+        df_dense = pandas.DataFrame(
+            {'POP': [1, 2, 3, 4]},
+            index=pandas.MultiIndex.from_product([[101, 102], [2020, 2021]], names=['G5', 'YEAR']))
+        xds = sdx.df_to_xds(df_dense, chunks=1)
+        self.assertEqual(xds['POP'].dtype, np.int64)
+        self.assertTrue(xds.compute().identical(xarray.Dataset.from_dataframe(df_dense)))
+
+    def test_estimate_dense_nbytes(self):
+        df = self._sparse_df()
+        # 4 G5 x 3 YEAR, with POP promoted to float64 and FLAG to object
+        self.assertEqual(sdx.estimate_dense_nbytes(df), 12 * (8 + 8 + 8))
+        self.assertEqual(sdx.estimate_dense_nbytes(df['POP']), 12 * 8)
+        self.assertEqual(sdx.estimate_dense_nbytes(df['POP'].reset_index(drop=True)), 5 * 8)
+
+        with self.assertRaises(ValueError):
+            sdx.df_to_xds(df, max_dense_bytes=100)
+        with self.assertRaises(ValueError):
+            sdx.ds_to_xda(df['POP'], max_dense_bytes=50)
+        self.assertTrue(sdx.df_to_xds(df, max_dense_bytes=1000).identical(
+            xarray.Dataset.from_dataframe(df)))
+
+    @unittest.skipUnless(importlib.util.find_spec('sparse'), 'sparse is not installed')
+    def test_df_to_xds_sparse(self):
+        df = self._sparse_df()
+        xds = sdx.df_to_xds(df, sparse=True, max_dense_bytes=100)
+        self.assertEqual(type(xds['POP'].data).__name__, 'COO')
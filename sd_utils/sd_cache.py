@@ -9,12 +9,502 @@ Notes :
 September 29, 2017
 """
 
+import collections
 import functools
+import hashlib
+import inspect
+import os
+import pickle
+import shutil
+import sys
+import threading
+import time
+import types
+import uuid
+from typing import Any, Callable, Optional, Hashable, Union
+
+import numpy as np
+import pandas
+import pyarrow
+import xarray
+
+from sd_utils.sd_config import SDConfig
 
 
 __all__ = [
     'cache',
+    'disk_cache',
 ]
 
 
-cache = functools.lru_cache(maxsize=1024)
+CacheInfo = collections.namedtuple(
+    'CacheInfo',
+    ['hits', 'misses', 'maxsize', 'currsize', 'nbytes', 'evictions', 'time_saved'])
+
+
+def cache(func: Optional[Callable] = None, *, max_bytes: Optional[int] = None,
+          maxsize: Optional[int] = None, ttl: Optional[Union[int, float]] = None,
+          fast_hash: bool = False) -> Callable:
+    """
+    In-memory memoization decorator, usable as @cache or @cache(max_bytes=...). Unlike
+    functools.lru_cache, arguments may be pandas, numpy or xarray objects, which are fingerprinted
+    by hashing their contents. The least recently used results are evicted once their estimated
+    memory use exceeds max_bytes.
+
+    The cache is thread-safe: concurrent calls with the same arguments wait for a single
+    computation instead of each running the function.
+
+    Parameters
+    ----------
+    func: callable
+        Function to decorate
+    max_bytes: int
+        Memory budget for the cached results, SDConfig.cache_max_bytes by default
+    maxsize: int
+        Optional limit on the number of cached results
+    ttl: int or float
+        Number of seconds a result stays valid
+    fast_hash: bool
+        Fingerprint pandas/numpy/xarray arguments by identity and shape instead of content. Only
+        correct if those arguments are not modified in place; they are kept alive while cached
+
+    Returns
+    -------
+    callable
+        Wrapped function with cache_info() and cache_clear() methods. cache_info() also reports
+        evictions and time_saved, the seconds of computation skipped by hits
+    """
+    if func is None:
+        return functools.partial(cache, max_bytes=max_bytes, maxsize=maxsize, ttl=ttl,
+                                 fast_hash=fast_hash)
+
+    assert callable(func)
+    assert isinstance(fast_hash, bool)
+
+    memo = _MemoCache(max_bytes=max_bytes, maxsize=maxsize, ttl=ttl)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        key = _fingerprint((args, sorted(kwargs.items())), fast_hash=fast_hash)
+        # With fast_hash the arguments are kept alive so their ids can't be reused
+        return memo.get_or_compute(key, functools.partial(func, *args, **kwargs),
+                                   keep_alive=(args, kwargs) if fast_hash else None)
+
+    wrapper.cache_info = memo.cache_info
+    wrapper.cache_clear = memo.cache_clear
+    return wrapper
+
+
+class _MemoCache:
+    """
+    Thread-safe LRU store behind cache, with a byte budget, optional TTL, single-flight
+    computation of missing keys and hit/miss statistics
+    """
+    _Entry = collections.namedtuple(
+        '_Entry', ['value', 'nbytes', 'expires_at', 'seconds', 'keep_alive'])
+
+    class _Flight:
+        def __init__(self) -> None:
+            self.done = threading.Event()
+            self.value = None
+            self.seconds = 0.
+            self.failed = False
+
+    def __init__(self, max_bytes: Optional[int] = None, maxsize: Optional[int] = None,
+                 ttl: Optional[Union[int, float]] = None,
+                 default_max_bytes: Callable[[], int] = lambda: SDConfig.cache_max_bytes) -> None:
+        assert max_bytes is None or (isinstance(max_bytes, int) and max_bytes > 0)
+        assert maxsize is None or (isinstance(maxsize, int) and maxsize > 0)
+        assert ttl is None or (isinstance(ttl, (int, float)) and ttl > 0)
+        assert callable(default_max_bytes)
+
+        self.max_bytes = max_bytes
+        self.default_max_bytes = default_max_bytes
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._flights = {}
+        self._stats = dict(hits=0, misses=0, nbytes=0, evictions=0, time_saved=0.)
+
+    @property
+    def budget(self) -> int:
+        return self.default_max_bytes() if self.max_bytes is None else self.max_bytes
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any],
+                       keep_alive: Any = None) -> Any:
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry.expires_at is not None and \
+                        entry.expires_at <= time.monotonic():
+                    self._pop(key)
+                    entry = None
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self._hit(entry.seconds)
+                    return entry.value
+
+                flight = self._flights.get(key)
+                if flight is None:
+                    flight = self._flights[key] = self._Flight()
+                    self._stats['misses'] += 1
+                    break
+
+            flight.done.wait()
+            if not flight.failed:
+                with self._lock:
+                    self._hit(flight.seconds)
+                return flight.value
+            # The computation we waited for raised, so try again (and likely compute it here)
+
+        try:
+            start_time = time.perf_counter()
+            value = compute()
+            seconds = time.perf_counter() - start_time
+        except BaseException:
+            with self._lock:
+                del self._flights[key]
+            flight.failed = True
+            flight.done.set()
+            raise
+
+        with self._lock:
+            self._store(key, value, seconds, keep_alive)
+            del self._flights[key]
+        flight.value = value
+        flight.seconds = seconds
+        flight.done.set()
+
+        return value
+
+    def cache_info(self) -> CacheInfo:
+        with self._lock:
+            return CacheInfo(hits=self._stats['hits'], misses=self._stats['misses'],
+                             maxsize=self.maxsize, currsize=len(self._entries),
+                             nbytes=self._stats['nbytes'], evictions=self._stats['evictions'],
+                             time_saved=self._stats['time_saved'])
+
+    def cache_clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._stats.update(hits=0, misses=0, nbytes=0, evictions=0, time_saved=0.)
+
+    # /// Internal only /// #
+    def _hit(self, seconds: float) -> None:
+        self._stats['hits'] += 1
+        self._stats['time_saved'] += seconds
+
+    def _store(self, key: Hashable, value: Any, seconds: float, keep_alive: Any) -> None:
+        nbytes = _estimate_nbytes(value)
+        if nbytes > self.budget:
+            return
+
+        if key in self._entries:
+            self._pop(key)
+        expires_at = None if self.ttl is None else time.monotonic() + self.ttl
+        self._entries[key] = self._Entry(value, nbytes, expires_at, seconds, keep_alive)
+        self._stats['nbytes'] += nbytes
+
+        while self._stats['nbytes'] > self.budget or \
+                (self.maxsize is not None and len(self._entries) > self.maxsize):
+            self._pop(next(iter(self._entries)))
+            self._stats['evictions'] += 1
+
+    def _pop(self, key: Hashable) -> None:
+        self._stats['nbytes'] -= self._entries.pop(key).nbytes
+
+
+def disk_cache(func: Optional[Callable] = None, *, cache_dir: Optional[str] = None,
+               max_bytes: Optional[int] = None, version: Optional[Hashable] = None) -> Callable:
+    """
+    Decorator which memoizes results on disk so they survive across processes. DataFrames are
+    stored as parquet files, anything else is pickled. Entries are keyed on the function's module
+    and qualname, a digest of its bytecode and constants, version, and its (picklable) arguments
+    bound to its signature with defaults applied, so f(2) and f(2, col='COL_INT') share an entry.
+    Once the cache directory holds more than max_bytes, the least recently used entries are
+    deleted. Each process keeps a running size of the directory and only walks it to evict once
+    that estimate crosses max_bytes.
+
+    Parameters
+    ----------
+    func: callable
+        Function to decorate
+    cache_dir: str
+        Directory to store entries in, SDConfig.cache_dir by default
+    max_bytes: int
+        Size budget for everything in cache_dir, SDConfig.disk_cache_max_bytes by default
+    version: hashable
+        Part of the key, to bump when the results change without the function's code changing
+        (e.g. a function it calls was edited)
+
+    Returns
+    -------
+    callable
+        Wrapped function, with a cache_clear() method deleting its entries
+    """
+    if func is None:
+        return functools.partial(
+            disk_cache, cache_dir=cache_dir, max_bytes=max_bytes, version=version)
+
+    assert callable(func)
+    assert cache_dir is None or isinstance(cache_dir, str)
+    assert max_bytes is None or (isinstance(max_bytes, int) and max_bytes > 0)
+    hash(version)
+
+    func_name = '{}.{}'.format(func.__module__, func.__qualname__)
+    func_version = (version, _code_digest(func))
+    try:
+        signature = inspect.signature(func)
+    except (TypeError, ValueError):
+        signature = None
+
+    def func_cache_dir() -> str:
+        return os.path.join(SDConfig.cache_dir if cache_dir is None else cache_dir, func_name)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            key = _disk_cache_key(
+                func_name, func_version, _bound_arguments(signature, args, kwargs))
+        except (pickle.PicklingError, TypeError, AttributeError):
+            # Arguments which can't be keyed are not cached
+            return func(*args, **kwargs)
+
+        entry_dir = func_cache_dir()
+        for extension in ('parquet', 'pkl'):
+            entry_path = os.path.join(entry_dir, '{}.{}'.format(key, extension))
+            try:
+                result = _load_disk_cache_entry(entry_path)
+            except FileNotFoundError:
+                continue
+            # The modification time tracks the last use of an entry for LRU eviction. An entry
+            # evicted since it was loaded is a miss
+            try:
+                os.utime(entry_path)
+            except FileNotFoundError:
+                continue
+            return result
+
+        result = func(*args, **kwargs)
+
+        os.makedirs(entry_dir, exist_ok=True)
+        entry_path = _store_disk_cache_entry(os.path.join(entry_dir, key), result)
+        _add_disk_cache_entry(
+            os.path.dirname(entry_dir), entry_path,
+            SDConfig.disk_cache_max_bytes if max_bytes is None else max_bytes)
+
+        return result
+
+    def cache_clear() -> None:
+        entry_dir = func_cache_dir()
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        with _disk_cache_lock:
+            _disk_cache_nbytes.pop(os.path.dirname(entry_dir), None)
+
+    wrapper.cache_clear = cache_clear
+    return wrapper
+
+
+# /// Internal only /// #
+def _fingerprint(obj: Any, fast_hash: bool = False) -> Hashable:
+    """
+    Hashable stand-in for obj. pandas, numpy and xarray objects are replaced by a digest of
+    their contents (or their identity and shape with fast_hash), containers are fingerprinted
+    element by element and anything else must be hashable itself
+    """
+    if isinstance(obj, (pandas.DataFrame, pandas.Series, pandas.Index, np.ndarray,
+                        xarray.DataArray, xarray.Dataset)):
+        if fast_hash:
+            shape = tuple(obj.sizes.items()) if isinstance(obj, xarray.Dataset) else obj.shape
+            return 'id', type(obj).__name__, id(obj), shape
+        return type(obj).__name__, _content_digest(obj)
+    if isinstance(obj, (tuple, list)):
+        return (type(obj).__name__,) + tuple(_fingerprint(o, fast_hash) for o in obj)
+    if isinstance(obj, dict):
+        return ('dict',) + tuple(
+            (_fingerprint(k, fast_hash), _fingerprint(v, fast_hash)) for k, v in obj.items())
+
+    hash(obj)
+    return obj
+
+
+def _content_digest(obj: Any) -> str:
+    digest = hashlib.sha1()
+
+    def update(o) -> None:
+        if isinstance(o, xarray.Dataset):
+            for name, variable in sorted(o.variables.items(), key=lambda item: str(item[0])):
+                digest.update(repr((name, variable.dims)).encode())
+                update(variable.values)
+        elif isinstance(o, xarray.DataArray):
+            digest.update(repr((o.name, o.dims)).encode())
+            update(o.values)
+            for name, coord in sorted(o.coords.items(), key=lambda item: str(item[0])):
+                digest.update(repr((name, coord.dims)).encode())
+                update(coord.values)
+        elif isinstance(o, np.ndarray) and o.dtype != object:
+            digest.update(repr((o.dtype.str, o.shape)).encode())
+            digest.update(np.ascontiguousarray(o).view(np.uint8))
+        elif isinstance(o, np.ndarray):
+            digest.update(repr(o.shape).encode())
+            digest.update(pandas.util.hash_array(o.ravel()).view(np.uint8))
+        elif isinstance(o, pandas.DataFrame):
+            digest.update(repr(list(zip(o.columns, o.dtypes.astype(str)))).encode())
+            digest.update(pandas.util.hash_pandas_object(o, index=True).values.view(np.uint8))
+        else:
+            digest.update(repr((o.name, str(o.dtype))).encode())
+            digest.update(pandas.util.hash_pandas_object(
+                o, index=isinstance(o, pandas.Series)).values.view(np.uint8))
+
+    update(obj)
+    return digest.hexdigest()
+
+
+def _estimate_nbytes(obj: Any) -> int:
+    if isinstance(obj, pandas.DataFrame):
+        return int(obj.memory_usage(index=True, deep=True).sum())
+    if isinstance(obj, (pandas.Series, pandas.Index)):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, (np.ndarray, xarray.DataArray, xarray.Dataset)):
+        return int(obj.nbytes)
+    if isinstance(obj, (tuple, list, set, frozenset)):
+        return sys.getsizeof(obj) + sum(_estimate_nbytes(o) for o in obj)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(
+            _estimate_nbytes(k) + _estimate_nbytes(v) for k, v in obj.items())
+    return sys.getsizeof(obj)
+
+
+def _disk_cache_key(func_name: str, func_version: tuple, arguments: list) -> str:
+    key_bytes = pickle.dumps(_fingerprint((func_name, func_version, arguments)), protocol=4)
+    return hashlib.sha256(key_bytes).hexdigest()
+
+
+def _bound_arguments(signature: Optional[inspect.Signature], args: tuple, kwargs: dict) -> list:
+    """
+    (name, value) pairs of the arguments of a call with defaults applied, so the same call spelt
+    differently has one key. Raises TypeError if they don't bind to the signature
+    """
+    if signature is None:
+        return [args, sorted(kwargs.items())]
+
+    bound = signature.bind(*args, **kwargs)
+    bound.apply_defaults()
+    return [(name, sorted(value.items())
+             if signature.parameters[name].kind is inspect.Parameter.VAR_KEYWORD else value)
+            for name, value in bound.arguments.items()]
+
+
+def _code_digest(func: Callable) -> str:
+    """
+    Digest of the bytecode, names and constants of func (and of the functions defined in it), so
+    editing the function changes its disk cache keys
+    """
+    code = getattr(inspect.unwrap(func), '__code__', None)
+    if code is None:
+        return ''
+
+    digest = hashlib.sha256()
+
+    def update(c: types.CodeType) -> None:
+        digest.update(c.co_code)
+        digest.update(repr(c.co_names).encode())
+        for const in c.co_consts:
+            if isinstance(const, types.CodeType):
+                update(const)
+            elif isinstance(const, frozenset):
+                # Set order depends on string hashing, which differs between processes
+                digest.update(repr(sorted(repr(o) for o in const)).encode())
+            else:
+                digest.update(repr(const).encode())
+
+    update(code)
+    return digest.hexdigest()
+
+
+def _load_disk_cache_entry(entry_path: str) -> Any:
+    if entry_path.endswith('.parquet'):
+        return pandas.read_parquet(entry_path, engine='pyarrow')
+
+    with open(entry_path, 'rb') as f:
+        return pickle.load(f)
+
+
+def _store_disk_cache_entry(entry_path_base: str, result: Any) -> str:
+    """
+    Writes to a temporary file first so concurrent readers never see a partial entry, returning
+    the path of the entry
+    """
+    tmp_path = '{}.{}.tmp'.format(entry_path_base, uuid.uuid4().hex)
+    try:
+        if type(result) is pandas.DataFrame and all(isinstance(c, str) for c in result.columns):
+            try:
+                result.to_parquet(tmp_path, engine='pyarrow')
+                os.replace(tmp_path, entry_path_base + '.parquet')
+                return entry_path_base + '.parquet'
+            except (pyarrow.ArrowException, ValueError, TypeError):
+                # e.g. object columns with mixed types, which are pickled instead
+                pass
+
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(result, f, protocol=4)
+        os.replace(tmp_path, entry_path_base + '.pkl')
+        return entry_path_base + '.pkl'
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+# Running estimate of the bytes held under each disk cache directory. Entries written by other
+# processes are only counted once the directory is walked again
+_disk_cache_nbytes = {}
+_disk_cache_lock = threading.Lock()
+
+
+def _add_disk_cache_entry(cache_dir: str, entry_path: str, max_bytes: int) -> None:
+    """
+    Adds a stored entry to the running size of cache_dir, walking the directory to evict entries
+    only when it isn't known yet or the estimate crosses max_bytes
+    """
+    try:
+        entry_nbytes = os.path.getsize(entry_path)
+    except FileNotFoundError:
+        entry_nbytes = 0
+
+    with _disk_cache_lock:
+        nbytes = _disk_cache_nbytes.get(cache_dir)
+        if nbytes is not None and nbytes + entry_nbytes <= max_bytes:
+            _disk_cache_nbytes[cache_dir] = nbytes + entry_nbytes
+            return
+        _disk_cache_nbytes[cache_dir] = _evict_disk_cache(cache_dir, max_bytes)
+
+
+def _evict_disk_cache(cache_dir: str, max_bytes: int) -> int:
+    """
+    Deletes the least recently used entries under cache_dir until it holds max_bytes or less,
+    returning the bytes left
+    """
+    entries = []
+    for dir_path, _, file_names in os.walk(cache_dir):
+        for file_name in file_names:
+            if file_name.endswith(('.parquet', '.pkl')):
+                entry_path = os.path.join(dir_path, file_name)
+                try:
+                    stat = os.stat(entry_path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry_path))
+
+    total_bytes = sum(size for _, size, _ in entries)
+    for _, size, entry_path in sorted(entries):
+        if total_bytes <= max_bytes:
+            break
+        try:
+            os.remove(entry_path)
+        except FileNotFoundError:
+            pass
+        total_bytes -= size
+
+    return total_bytes
@@ -11,7 +11,7 @@ November 28, 2016
 StratoDem Analytics, LLC
 """
 
-from typing import Any, Union, List
+from typing import Any, Union, List, Optional
 
 import dask.dataframe
 import geopandas
@@ -19,6 +19,8 @@ import numpy as np
 import pandas
 import xarray
 
+from sd_utils.sd_config import SDConfig
+
 __all__ = [
     'T_INT', 'T_FLOAT', 'T_NUM',
     'T_DS', 'T_DF',
@@ -63,52 +65,76 @@ T_COL = Union[str, List[str]]
 
 
 # /// data type checking functions /// #
-def check_ds(ds: Any, msg: str='Is not a Series') -> T_DS:
+# Each check_* function returns a copy of what it checked, as described by its copy argument or
+# SDConfig.check_copy if it isn't given:
+#   'deep': a full copy (default)
+#   'view': a new object sharing the data. pandas/xarray objects get a shallow copy (copy-on-write
+#       when pandas copy_on_write is enabled), ndarrays get a read-only view
+#   'none': the object itself
+def check_ds(ds: Any, msg: str='Is not a Series', *, copy: Optional[str]=None) -> T_DS:
     assert isinstance(msg, str)
     assert isinstance(ds, pandas.Series), msg
-    return ds.copy()
+    return _copy(ds, copy)
 
 
-def check_df(df: Any, msg: str='Is not a DataFrame') -> T_DF:
+def check_df(df: Any, msg: str='Is not a DataFrame', *, copy: Optional[str]=None) -> T_DF:
     assert isinstance(msg, str)
     assert isinstance(df, pandas.DataFrame), msg
-    return df.copy()
+    return _copy(df, copy)
 
 
-def check_gdf(df: Any, msg: str='Is not a GeoDataFrame') -> T_GDF:
+def check_gdf(df: Any, msg: str='Is not a GeoDataFrame', *, copy: Optional[str]=None) -> T_GDF:
     assert isinstance(msg, str)
     assert isinstance(df, geopandas.GeoDataFrame), msg
-    return df.copy()
+    return _copy(df, copy)
 
 
-def check_xds(xds: Any, msg: str='Is not a Dataset') -> T_XDS:
+def check_xds(xds: Any, msg: str='Is not a Dataset', *, copy: Optional[str]=None) -> T_XDS:
     assert isinstance(msg, str)
     assert isinstance(xds, xarray.Dataset), msg
-    return xds.copy()
+    return _copy(xds, copy)
 
 
-def check_xda(xda: Any, msg: str='Is not a DataArray') -> T_XDA:
+def check_xda(xda: Any, msg: str='Is not a DataArray', *, copy: Optional[str]=None) -> T_XDA:
     assert isinstance(msg, str)
     assert isinstance(xda, xarray.DataArray), msg
-    return xda.copy()
+    return _copy(xda, copy)
 
 
-def check_ddf(ddf: Any, msg: str='Is not a dask DataFrame') -> T_DDF:
+def check_ddf(ddf: Any, msg: str='Is not a dask DataFrame', *, copy: Optional[str]=None) -> T_DDF:
     assert isinstance(msg, str)
     assert isinstance(ddf, dask.dataframe.DataFrame), msg
-    return ddf.copy()
+    return _copy(ddf, copy)
 
 
-def check_dds(dds: Any, msg: str='Is not a dask Series') -> T_DDS:
+def check_dds(dds: Any, msg: str='Is not a dask Series', *, copy: Optional[str]=None) -> T_DDS:
     assert isinstance(msg, str)
     assert isinstance(dds, dask.dataframe.Series), msg
-    return dds.copy()
+    return _copy(dds, copy)
 
 
-def check_ndarray(nd: Any, msg: str='Is not an ndarray') -> np.ndarray:
+def check_ndarray(nd: Any, msg: str='Is not an ndarray', *, copy: Optional[str]=None) -> np.ndarray:
     assert isinstance(msg, str)
     assert isinstance(nd, np.ndarray), msg
-    return nd.copy()
+    return _copy(nd, copy)
+
+
+def _copy(obj: Any, copy: Optional[str]) -> Any:
+    copy = SDConfig.check_copy if copy is None else copy
+    assert copy in ('deep', 'view', 'none')
+
+    if copy == 'none':
+        return obj
+    if isinstance(obj, (dask.dataframe.DataFrame, dask.dataframe.Series)):
+        # dask collections are immutable graphs, so their copy is always shallow
+        return obj.copy()
+    if copy == 'view':
+        if isinstance(obj, np.ndarray):
+            view = obj.view()
+            view.flags.writeable = False
+            return view
+        return obj.copy(deep=False)
+    return obj.copy()
 
 
 # /// other type checking functions
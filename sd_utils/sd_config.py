@@ -9,7 +9,8 @@ Notes :
 September 29, 2017
 """
 
-from typing import Optional
+import os
+from typing import Optional, Union
 
 
 __all__ = [
@@ -18,15 +19,67 @@ __all__ = [
 
 
 class SDConfigClass:
-    def __init__(self, cpu_count: int=8, npartitions: int=8, slack_api_token: Optional[str]=None,
-                 slack_channel: Optional[str]=None, slack_personal_prefix: Optional[str]=None):
+    def __init__(self, cpu_count: Optional[int]=None, npartitions: Optional[int]=None,
+                 memory_limit: Optional[int]=None, slack_api_token: Optional[str]=None,
+                 slack_channel: Optional[str]=None, slack_personal_prefix: Optional[str]=None,
+                 scratch_dir: Optional[str]=None, multi_read_transport: str='arrow',
+                 check_copy: str='deep', persistent_pool: bool=False,
+                 cache_dir: str=os.path.join(os.path.expanduser('~'), '.cache', 'sd_utils'),
+                 disk_cache_max_bytes: int=10 * 2 ** 30, cache_max_bytes: int=2 ** 30,
+                 read_cache: bool=False, read_cache_max_bytes: int=2 * 2 ** 30,
+                 partition_bytes: Optional[int]=128 * 2 ** 20,
+                 dask_scheduler: Optional[str]=None, dask_workers: Optional[int]=None,
+                 dask_memory_limit: Optional[Union[int, str]]=None, log_async: bool=False,
+                 slack_base_url: Optional[str]=None, metrics: bool=True):
+        # Unset limits come from the environment variables SDUTILS_CPU_COUNT, SDUTILS_NPARTITIONS
+        # and SDUTILS_MEMORY_LIMIT, or are detected from the container and the machine
+        if cpu_count is None:
+            cpu_count = _env_int('SDUTILS_CPU_COUNT') or _detect_cpu_count()
+        if npartitions is None:
+            npartitions = _env_int('SDUTILS_NPARTITIONS') or cpu_count
+        if memory_limit is None:
+            memory_limit = _env_int('SDUTILS_MEMORY_LIMIT') or _detect_memory_limit()
+
         self._cpu_count = cpu_count
         self.cpu_count = cpu_count
         self._npartitions = npartitions
         self.npartitions = npartitions
+        self._memory_limit = memory_limit
+        self.memory_limit = memory_limit
         self._slack_api_token = slack_api_token
         self._slack_channel = slack_channel
         self._slack_personal_prefix = slack_personal_prefix
+        self._scratch_dir = scratch_dir
+        self._multi_read_transport = multi_read_transport
+        self.multi_read_transport = multi_read_transport
+        self._check_copy = check_copy
+        self.check_copy = check_copy
+        self._persistent_pool = persistent_pool
+        self.persistent_pool = persistent_pool
+        self._cache_dir = cache_dir
+        self.cache_dir = cache_dir
+        self._disk_cache_max_bytes = disk_cache_max_bytes
+        self.disk_cache_max_bytes = disk_cache_max_bytes
+        self._cache_max_bytes = cache_max_bytes
+        self.cache_max_bytes = cache_max_bytes
+        self._read_cache = read_cache
+        self.read_cache = read_cache
+        self._read_cache_max_bytes = read_cache_max_bytes
+        self.read_cache_max_bytes = read_cache_max_bytes
+        self._partition_bytes = partition_bytes
+        self.partition_bytes = partition_bytes
+        self._dask_scheduler = dask_scheduler
+        self.dask_scheduler = dask_scheduler
+        self._dask_workers = dask_workers
+        self.dask_workers = dask_workers
+        self._dask_memory_limit = dask_memory_limit
+        self.dask_memory_limit = dask_memory_limit
+        self._log_async = log_async
+        self.log_async = log_async
+        self._slack_base_url = slack_base_url
+        self.slack_base_url = slack_base_url
+        self._metrics = metrics
+        self.metrics = metrics
 
     @property
     def cpu_count(self) -> int:
@@ -48,6 +101,17 @@ class SDConfigClass:
 
         self._npartitions = npartitions
 
+    @property
+    def memory_limit(self) -> int:
+        """Bytes of memory available to the process, e.g. its container's memory limit"""
+        return self._memory_limit
+
+    @memory_limit.setter
+    def memory_limit(self, memory_limit: int) -> None:
+        assert isinstance(memory_limit, int) and memory_limit > 0
+
+        self._memory_limit = memory_limit
+
     @property
     def slack_api_token(self) -> str:
         return self._slack_api_token
@@ -78,5 +142,274 @@ class SDConfigClass:
 
         self._slack_personal_prefix = slack_personal_prefix
 
+    @property
+    def scratch_dir(self) -> Optional[str]:
+        """Directory for temporary files, e.g. '/dev/shm'. None uses the system temp directory"""
+        return self._scratch_dir
+
+    @scratch_dir.setter
+    def scratch_dir(self, scratch_dir: Optional[str]) -> None:
+        assert scratch_dir is None or isinstance(scratch_dir, str)
+
+        self._scratch_dir = scratch_dir
+
+    @property
+    def multi_read_transport(self) -> str:
+        """How multi_read worker processes return DataFrames: 'arrow' (IPC files) or 'pickle'"""
+        return self._multi_read_transport
+
+    @multi_read_transport.setter
+    def multi_read_transport(self, multi_read_transport: str) -> None:
+        assert multi_read_transport in ('arrow', 'pickle')
+
+        self._multi_read_transport = multi_read_transport
+
+    @property
+    def check_copy(self) -> str:
+        """What sd_checks.check_* functions return: 'deep' copies, shallow 'view's or 'none'"""
+        return self._check_copy
+
+    @check_copy.setter
+    def check_copy(self, check_copy: str) -> None:
+        assert check_copy in ('deep', 'view', 'none')
+
+        self._check_copy = check_copy
+
+    @property
+    def persistent_pool(self) -> bool:
+        """
+        Keep multi_read worker pools warm between calls. Worker processes keep the SDConfig
+        they started with, so shut them down with sd_load.shutdown_worker_pools after changing it
+        """
+        return self._persistent_pool
+
+    @persistent_pool.setter
+    def persistent_pool(self, persistent_pool: bool) -> None:
+        assert isinstance(persistent_pool, bool)
+
+        self._persistent_pool = persistent_pool
+
+    @property
+    def cache_dir(self) -> str:
+        """Directory for sd_cache.disk_cache entries"""
+        return self._cache_dir
+
+    @cache_dir.setter
+    def cache_dir(self, cache_dir: str) -> None:
+        assert isinstance(cache_dir, str)
+
+        self._cache_dir = cache_dir
+
+    @property
+    def disk_cache_max_bytes(self) -> int:
+        """Size budget for everything under cache_dir"""
+        return self._disk_cache_max_bytes
+
+    @disk_cache_max_bytes.setter
+    def disk_cache_max_bytes(self, disk_cache_max_bytes: int) -> None:
+        assert isinstance(disk_cache_max_bytes, int) and disk_cache_max_bytes > 0
+
+        self._disk_cache_max_bytes = disk_cache_max_bytes
+
+    @property
+    def cache_max_bytes(self) -> int:
+        """Default memory budget of each sd_cache.cache decorated function"""
+        return self._cache_max_bytes
+
+    @cache_max_bytes.setter
+    def cache_max_bytes(self, cache_max_bytes: int) -> None:
+        assert isinstance(cache_max_bytes, int) and cache_max_bytes > 0
+
+        self._cache_max_bytes = cache_max_bytes
+
+    @property
+    def read_cache(self) -> bool:
+        """Cache the results of sd_load.read_df_* functions in memory by default"""
+        return self._read_cache
+
+    @read_cache.setter
+    def read_cache(self, read_cache: bool) -> None:
+        assert isinstance(read_cache, bool)
+
+        self._read_cache = read_cache
+
+    @property
+    def read_cache_max_bytes(self) -> int:
+        """Memory budget of the sd_load read cache"""
+        return self._read_cache_max_bytes
+
+    @read_cache_max_bytes.setter
+    def read_cache_max_bytes(self, read_cache_max_bytes: int) -> None:
+        assert isinstance(read_cache_max_bytes, int) and read_cache_max_bytes > 0
+
+        self._read_cache_max_bytes = read_cache_max_bytes
+
+    @property
+    def partition_bytes(self) -> Optional[int]:
+        """
+        Target in-memory size of the partitions made by sd_ddf.df_to_ddf. None splits into
+        npartitions partitions instead
+        """
+        return self._partition_bytes
+
+    @partition_bytes.setter
+    def partition_bytes(self, partition_bytes: Optional[int]) -> None:
+        assert partition_bytes is None or (isinstance(partition_bytes, int) and partition_bytes > 0)
+
+        self._partition_bytes = partition_bytes
+
+    @property
+    def dask_scheduler(self) -> Optional[str]:
+        """
+        dask scheduler of sd_ddf and sd_load computations (see sd_ddf.dask_scheduler):
+        'threads', 'processes', 'synchronous' or 'distributed' for a local distributed cluster.
+        None leaves dask's own default
+        """
+        return self._dask_scheduler
+
+    @dask_scheduler.setter
+    def dask_scheduler(self, dask_scheduler: Optional[str]) -> None:
+        assert dask_scheduler in (None, 'threads', 'processes', 'synchronous', 'distributed')
+
+        self._dask_scheduler = dask_scheduler
+
+    @property
+    def dask_workers(self) -> Optional[int]:
+        """Number of dask workers. None uses cpu_count"""
+        return self._dask_workers
+
+    @dask_workers.setter
+    def dask_workers(self, dask_workers: Optional[int]) -> None:
+        assert dask_workers is None or (isinstance(dask_workers, int) and dask_workers > 0)
+
+        self._dask_workers = dask_workers
+
+    @property
+    def dask_memory_limit(self) -> Optional[Union[int, str]]:
+        """
+        Memory limit of each worker of the 'distributed' scheduler, in bytes or as a string like
+        '4GB'. None splits memory_limit between the workers
+        """
+        return self._dask_memory_limit
+
+    @dask_memory_limit.setter
+    def dask_memory_limit(self, dask_memory_limit: Optional[Union[int, str]]) -> None:
+        assert dask_memory_limit is None or isinstance(dask_memory_limit, (int, str))
+
+        self._dask_memory_limit = dask_memory_limit
+
+    @property
+    def log_async(self) -> bool:
+        """
+        Print SDLog messages in batches from a background thread instead of in the calling
+        thread. Pending messages are flushed at exit or by sd_log.flush_logs
+        """
+        return self._log_async
+
+    @log_async.setter
+    def log_async(self, log_async: bool) -> None:
+        assert isinstance(log_async, bool)
+
+        self._log_async = log_async
+
+    @property
+    def slack_base_url(self) -> Optional[str]:
+        """Base URL of the Slack Web API. None uses Slack's own"""
+        return self._slack_base_url
+
+    @slack_base_url.setter
+    def slack_base_url(self, slack_base_url: Optional[str]) -> None:
+        assert slack_base_url is None or isinstance(slack_base_url, str)
+
+        self._slack_base_url = slack_base_url
+
+    @property
+    def metrics(self) -> bool:
+        """Record the duration and memory use of SDLog contexts in sd_metrics"""
+        return self._metrics
+
+    @metrics.setter
+    def metrics(self, metrics: bool) -> None:
+        assert isinstance(metrics, bool)
+
+        self._metrics = metrics
+
+
+# /// Internal only /// #
+def _env_int(name: str) -> Optional[int]:
+    """Integer value of environment variable name, with an optional K/M/G/T suffix"""
+    value = os.environ.get(name, '').strip().upper()
+    if not value:
+        return None
+
+    multiplier = 1
+    if value[-1] in 'KMGT':
+        multiplier = 2 ** (10 * ('KMGT'.index(value[-1]) + 1))
+        value = value[:-1]
+    try:
+        return int(float(value) * multiplier)
+    except ValueError:
+        raise ValueError('{} should be an integer, got {!r}'.format(name, os.environ[name]))
+
+
+def _read_cgroup_file(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except (OSError, ValueError):
+        return None
+
+
+def _detect_cpu_count(cgroup_root: str='/sys/fs/cgroup') -> int:
+    """
+    CPUs this process can use: the CPUs in its affinity mask, capped by the CPU quota of its
+    cgroup (v2 cpu.max, or v1 cpu.cfs_quota_us / cpu.cfs_period_us) rounded up
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        cpu_count = len(os.sched_getaffinity(0))
+    else:
+        cpu_count = os.cpu_count() or 1
+
+    quota, period = None, None
+    cpu_max = _read_cgroup_file(os.path.join(cgroup_root, 'cpu.max'))
+    if cpu_max is not None:
+        quota, _, period = cpu_max.partition(' ')
+    else:
+        for cpu_dir in ('cpu', 'cpu,cpuacct'):
+            quota = _read_cgroup_file(os.path.join(cgroup_root, cpu_dir, 'cpu.cfs_quota_us'))
+            period = _read_cgroup_file(os.path.join(cgroup_root, cpu_dir, 'cpu.cfs_period_us'))
+            if quota is not None:
+                break
+
+    try:
+        quota, period = int(quota), int(period)
+    except (TypeError, ValueError):
+        # No cgroup, or 'max' / -1 for no quota
+        return max(cpu_count, 1)
+
+    if quota > 0 and period > 0:
+        cpu_count = min(cpu_count, -(-quota // period))
+    return max(cpu_count, 1)
+
+
+def _detect_memory_limit(cgroup_root: str='/sys/fs/cgroup') -> int:
+    """
+    Bytes of memory this process can use: the physical memory of the machine, capped by the
+    memory limit of its cgroup (v2 memory.max, or v1 memory.limit_in_bytes)
+    """
+    try:
+        memory = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, OSError, ValueError):
+        memory = None
+
+    for path in ('memory.max', os.path.join('memory', 'memory.limit_in_bytes')):
+        limit = _read_cgroup_file(os.path.join(cgroup_root, path))
+        if limit is not None and limit.isdigit():
+            # cgroup v1 reports no limit as a number near 2 ** 63
+            memory = int(limit) if memory is None else min(memory, int(limit))
+            break
+
+    return memory if memory else 8 * 2 ** 30
+
 
 SDConfig = SDConfigClass()
@@ -11,6 +11,14 @@ June 06, 2017
 StratoDem Analytics, LLC
 """
 
+import atexit
+import contextlib
+import contextvars
+import math
+import shutil
+import tempfile
+from typing import Dict, Iterator, Optional, Tuple, Union
+
 import dask
 import dask.dataframe
 import dask.multiprocessing
@@ -19,19 +27,218 @@ import pandas
 from sd_utils.sd_config import SDConfig
 
 
-__all__ = ['df_to_ddf', 'ddf_checkpoint']
+__all__ = ['df_to_ddf', 'ddf_checkpoint', 'remove_checkpoint', 'dask_scheduler']
 
 
 T_DDF = dask.dataframe.DataFrame
 
 
-def df_to_ddf(df: pandas.DataFrame, *, npartitions: int=SDConfig.npartitions) -> T_DDF:
+def df_to_ddf(df: pandas.DataFrame, *, npartitions: Optional[int]=None,
+              partition_bytes: Optional[int]=None, index: Optional[str]=None,
+              sort: bool=True) -> T_DDF:
+    """
+    Splits df into a dask DataFrame
+
+    Parameters
+    ----------
+    df: pandas.DataFrame
+    npartitions: int
+        Number of partitions
+    partition_bytes: int
+        Target in-memory size of each partition, used to choose the number of partitions from
+        the memory usage of df when npartitions isn't given, with at least SDConfig.npartitions
+        partitions (one per row for shorter frames) so small frames are still split between
+        workers. Defaults to SDConfig.partition_bytes, or SDConfig.npartitions partitions if that
+        is None
+    index: str
+        Column to set as the index before splitting
+    sort: bool
+        Sort df by its index so the divisions of the partitions are known, letting joins and
+        .loc lookups on the index skip the shuffle
+    """
     assert isinstance(df, pandas.DataFrame)
-    assert isinstance(npartitions, int)
-    return dask.dataframe.from_pandas(df, npartitions=npartitions)
+    assert npartitions is None or (isinstance(npartitions, int) and npartitions > 0)
+    assert partition_bytes is None or (isinstance(partition_bytes, int) and partition_bytes > 0)
+    assert index is None or isinstance(index, str)
+    assert isinstance(sort, bool)
+
+    if index is not None:
+        df = df.set_index(index)
+
+    if npartitions is None:
+        if partition_bytes is None:
+            partition_bytes = SDConfig.partition_bytes
+        npartitions = SDConfig.npartitions if partition_bytes is None \
+            else max(_npartitions_for_bytes(df, partition_bytes),
+                     min(SDConfig.npartitions, len(df)))
+
+    return dask.dataframe.from_pandas(df, npartitions=npartitions, sort=sort)
 
 
-def ddf_checkpoint(ddf: T_DDF, *, npartitions: int=SDConfig.npartitions) -> T_DDF:
+def ddf_checkpoint(ddf: T_DDF, *, npartitions: Optional[int]=None, mode: str='compute',
+                   scratch_dir: Optional[str]=None) -> T_DDF:
+    """
+    Computes ddf and returns a dask DataFrame of the result whose task graph starts from it,
+    so later computations don't re-execute the work upstream of the checkpoint
+
+    Parameters
+    ----------
+    ddf: dask.dataframe.DataFrame
+    npartitions: int
+        Number of partitions of the result. Defaults to the df_to_ddf default in 'compute'
+        mode and to the partitions of ddf otherwise
+    mode: str
+        'compute': collect ddf into a pandas DataFrame in this process and split it again with
+            df_to_ddf
+        'persist': keep the computed partitions in the memory of the scheduler's workers
+        'parquet': write the partitions to Parquet files in a scratch directory and re-open
+            them lazily, so the result doesn't need to fit in memory. The files are removed
+            by remove_checkpoint, or when the interpreter exits
+    scratch_dir: str
+        Directory for the 'parquet' scratch files. Defaults to SDConfig.scratch_dir, or the
+        system temporary directory
+    """
     assert isinstance(ddf, dask.dataframe.DataFrame)
-    assert isinstance(npartitions, int)
-    return df_to_ddf(ddf.compute())
+    assert npartitions is None or isinstance(npartitions, int)
+    assert mode in ('compute', 'persist', 'parquet')
+    assert scratch_dir is None or isinstance(scratch_dir, str)
+
+    if mode == 'compute':
+        with _job_scheduler():
+            return df_to_ddf(ddf.compute(), npartitions=npartitions)
+
+    if mode == 'persist':
+        with _job_scheduler():
+            ddf = ddf.persist()
+    else:
+        checkpoint_dir = tempfile.mkdtemp(
+            prefix='sd_utils_checkpoint_',
+            dir=SDConfig.scratch_dir if scratch_dir is None else scratch_dir)
+        with _job_scheduler():
+            ddf.to_parquet(checkpoint_dir, write_index=True)
+        ddf = dask.dataframe.read_parquet(checkpoint_dir)
+
+    if npartitions is not None and npartitions != ddf.npartitions:
+        ddf = ddf.repartition(npartitions=npartitions)
+    if mode == 'parquet':
+        _checkpoint_dirs[ddf._name] = checkpoint_dir
+    return ddf
+
+
+def remove_checkpoint(ddf: T_DDF) -> None:
+    """
+    Removes the scratch files of a 'parquet' ddf_checkpoint result, which can't be computed
+    afterwards. Does nothing for other dask DataFrames, e.g. in a loop checkpointing each step
+        ddf_step = ddf_checkpoint(f(ddf), mode='parquet')
+        remove_checkpoint(ddf)
+        ddf = ddf_step
+    """
+    assert isinstance(ddf, dask.dataframe.DataFrame)
+
+    checkpoint_dir = _checkpoint_dirs.pop(ddf._name, None)
+    if checkpoint_dir is not None:
+        shutil.rmtree(checkpoint_dir, ignore_errors=True)
+
+
+@contextlib.contextmanager
+def dask_scheduler(scheduler: Optional[str]=None, *, workers: Optional[int]=None,
+                   memory_limit: Optional[Union[int, str]]=None) -> Iterator[None]:
+    """
+    Context manager running the dask computations inside it on a scheduler. sd_ddf and sd_load
+    functions enter it with the SDConfig defaults themselves, so setting SDConfig.dask_scheduler
+    configures a whole job; inside an explicit dask_scheduler block they use its scheduler
+
+    Parameters
+    ----------
+    scheduler: str
+        'threads', 'processes', 'synchronous' or 'distributed' for a local distributed cluster,
+        which is started on first use and kept until exit. Defaults to SDConfig.dask_scheduler;
+        if that is None dask's own default is left as is
+    workers: int
+        Number of workers. Defaults to SDConfig.dask_workers, or SDConfig.cpu_count
+    memory_limit: int or str
+        Memory limit of each 'distributed' worker. Defaults to SDConfig.dask_memory_limit
+    """
+    if scheduler is None:
+        scheduler = SDConfig.dask_scheduler
+    if workers is None:
+        workers = SDConfig.cpu_count if SDConfig.dask_workers is None else SDConfig.dask_workers
+    if memory_limit is None:
+        memory_limit = SDConfig.dask_memory_limit
+    assert scheduler in (None, 'threads', 'processes', 'synchronous', 'distributed')
+    assert isinstance(workers, int) and workers > 0
+    assert memory_limit is None or isinstance(memory_limit, (int, str))
+
+    with contextlib.ExitStack() as stack:
+        if scheduler is None:
+            config = {}
+        elif scheduler == 'distributed':
+            # The current client, so persist keeps futures on the workers and get_client()
+            # inside the block finds it
+            client = _local_client(workers, memory_limit)
+            stack.enter_context(client.as_current())
+            config = {'scheduler': client.get}
+        else:
+            config = {'scheduler': scheduler, 'num_workers': workers}
+
+        stack.enter_context(dask.config.set(config))
+        depth_token = _scheduler_depth.set(_scheduler_depth.get() + 1)
+        try:
+            yield
+        finally:
+            _scheduler_depth.reset(depth_token)
+
+
+# /// Internal only /// #
+# Number of dask_scheduler blocks entered in this thread or task, so functions called inside one
+# keep its scheduler
+_scheduler_depth = contextvars.ContextVar('sd_utils_scheduler_depth', default=0)
+# Local distributed clients by number of workers and memory limit, closed at exit
+_local_clients = {}  # type: Dict[Tuple[int, Optional[Union[int, str]]], object]
+
+
+def _job_scheduler():
+    """dask_scheduler with the SDConfig defaults, unless already inside a dask_scheduler block"""
+    return contextlib.nullcontext() if _scheduler_depth.get() else dask_scheduler()
+
+
+def _local_client(workers: int, memory_limit: Optional[Union[int, str]]):
+    """Client of a local distributed cluster of single-threaded worker processes"""
+    key = (workers, memory_limit)
+    if key not in _local_clients:
+        from distributed import Client, LocalCluster
+
+        cluster = LocalCluster(
+            n_workers=workers, threads_per_worker=1,
+            memory_limit=SDConfig.memory_limit // workers if memory_limit is None
+            else memory_limit)
+        _local_clients[key] = Client(cluster, set_as_default=False)
+    return _local_clients[key]
+
+
+@atexit.register
+def _close_local_clients() -> None:
+    while _local_clients:
+        client = _local_clients.popitem()[1]
+        try:
+            client.close()
+            client.cluster.close()
+        except Exception:
+            pass
+
+
+def _npartitions_for_bytes(df: pandas.DataFrame, partition_bytes: int) -> int:
+    """Number of partitions of about partition_bytes each to split df into"""
+    nbytes = int(df.memory_usage(index=True, deep=True).sum())
+    return max(1, min(len(df), math.ceil(nbytes / partition_bytes)))
+
+
+# Scratch directories of 'parquet' checkpoints by the name of the dask DataFrame reading them,
+# removed by remove_checkpoint or at exit since the DataFrames read from them lazily
+_checkpoint_dirs = {}  # type: Dict[str, str]
+
+
+@atexit.register
+def _remove_checkpoint_dirs() -> None:
+    while _checkpoint_dirs:
+        shutil.rmtree(_checkpoint_dirs.popitem()[1], ignore_errors=True)
@@ -11,38 +11,55 @@ December 12, 2016
 StratoDem Analytics, LLC
 """
 
+import atexit
+import contextlib
 import functools
+import importlib
+import inspect
+import json
 import multiprocessing
 import os
+import shutil
+import tempfile
+import urllib.parse
+import uuid
 import warnings
-from io import StringIO
-from typing import Callable, Optional, List, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO, StringIO
+from typing import Callable, Optional, List, Iterable, Iterator, Union
 
 import dask.dataframe
 import joblib
 import geopandas
+import numpy as np
 import pandas
+import pyarrow
+import pyarrow.csv
+import pyarrow.ipc
+import pyarrow.parquet
 import simpledbf
 import xarray
 
-from . import sd_log, sd_checks
+from . import sd_log, sd_checks, sd_cache, sd_ddf, sd_trace
 from sd_utils.sd_config import SDConfig
 
 __all__ = [
     'read_df_csv', 'read_df_json', 'read_df_fwf', 'read_df_hdf', 'read_df_stata', 'read_df_dbf',
     'read_df_geopandas', 'read_df_excel', 'read_df_parquet', 'read_ddf_parquet',
 
+    'iter_read_df_csv', 'iter_read_df_fwf',
+
     'multi_read_df_csv', 'multi_read_df_fwf', 'multi_read_df_geopandas', 'multi_read_df_excel',
-    'multi_read_df_stata',
+    'multi_read_df_stata', 'multi_read_df_parquet',
     'multi_joblib_read_df_csv',
 
     'write_df_csv', 'write_df_csv_stringio', 'write_df_hdf', 'write_df_parquet',
     'write_ddf_parquet',
 
-    'read_xds_netcdf',
-    'write_xds_netcdf',
+    'read_xds_netcdf', 'read_xds_mfnetcdf', 'read_xds_zarr',
+    'write_xds_netcdf', 'write_xds_zarr',
 
-    'file_size',
+    'file_size', 'shutdown_worker_pools', 'read_cache_info', 'clear_read_cache',
 ]
 
 T_DF = sd_checks.T_DF
@@ -51,44 +68,158 @@ T_DDF = sd_checks.T_DDF
 
 T_CB = Callable[[T_DF, str], T_DF]
 
+# Target number of bytes of the source file to parse per chunk in chunked readers
+_DEFAULT_CHUNK_BYTES = 64 * 2 ** 20
+# Multi reads of less than this many bytes in total run serially rather than on a worker pool
+_SERIAL_MAX_BYTES = 32 * 2 ** 20
+
+
+# ///// Read cache ///// #
+_read_cache = sd_cache._MemoCache(default_max_bytes=lambda: SDConfig.read_cache_max_bytes)
+
+
+def _read_through_cache(read_func: Callable) -> Callable:
+    """
+    Decorator adding an in-memory read-through cache to a reader whose first argument is a file
+    path. Results are keyed on the reader, the path, its modification time and size and the
+    other arguments, so they are invalidated as soon as the file changes. Adds two arguments:
+        read_cache: bool
+            Use the cache, SDConfig.read_cache by default
+        read_only: bool
+            Return the cached frame itself instead of a copy. The caller must not modify it
+    """
+    signature = inspect.signature(read_func)
+    path_param = next(iter(signature.parameters))
+
+    @functools.wraps(read_func)
+    def wrapper(*args, read_cache: Optional[bool] = None, read_only: bool = False, **kwargs):
+        read_cache = SDConfig.read_cache if read_cache is None else read_cache
+        assert isinstance(read_cache, bool)
+        assert isinstance(read_only, bool)
+
+        if not read_cache:
+            return read_func(*args, **kwargs)
+
+        arguments = signature.bind(*args, **kwargs).arguments
+        file_path = arguments.pop(path_param)
+        try:
+            key = sd_cache._fingerprint((
+                read_func.__qualname__, os.path.abspath(file_path), _path_version(file_path),
+                sorted(arguments.items())))
+        except (TypeError, OSError):
+            # Unhashable arguments or paths which aren't local files are read without the cache
+            return read_func(*args, **kwargs)
+
+        df = _read_cache.get_or_compute(key, functools.partial(read_func, *args, **kwargs))
+        return df if read_only else df.copy()
+
+    return wrapper
+
+
+def _path_version(file_path: str) -> tuple:
+    """Latest modification time and total size of a file, or of the files in a directory"""
+    if not os.path.isdir(file_path):
+        stat = os.stat(file_path)
+        return stat.st_mtime_ns, stat.st_size
+
+    stats = [os.stat(os.path.join(dir_path, f))
+             for dir_path, _, file_names in os.walk(file_path) for f in file_names]
+    return max([s.st_mtime_ns for s in stats], default=0), sum(s.st_size for s in stats)
+
+
+def read_cache_info() -> sd_cache.CacheInfo:
+    return _read_cache.cache_info()
+
+
+def clear_read_cache() -> None:
+    _read_cache.cache_clear()
+
 
 # ///// Read DF - Normal /////
 @sd_log.log_func
-def read_df_csv(csv_file_path: str, *, callback: Optional[T_CB] = None, **pandas_kwargs) -> T_DF:
-    """Standard csv loading function. Can be used for almost all csv files"""
+@_read_through_cache
+def read_df_csv(csv_file_path: str, *, callback: Optional[T_CB] = None,
+                engine: Optional[str] = None, split_bytes: Optional[int] = None,
+                **pandas_kwargs) -> T_DF:
+    """
+    Standard csv loading function. Can be used for almost all csv files
+
+    Parameters
+    ----------
+    csv_file_path: str
+    callback: callable
+        Called as callback(df=df, file_path=csv_file_path) on the loaded DataFrame
+    engine: str
+        'pyarrow' parses with the multi-threaded Arrow CSV reader and converts to pandas once,
+        with the same missing values and text (not date) columns as the pandas engine.
+        Otherwise passed through to pandas.read_csv
+    split_bytes: int
+        If given, split the file into byte ranges of about split_bytes at line boundaries and
+        parse the ranges on SDConfig.cpu_count processes
+    pandas_kwargs:
+        kwargs to pandas.read_csv. With engine='pyarrow' only the subset translated by
+        _pyarrow_csv_options is supported
+    """
     assert isinstance(csv_file_path, str)
     assert callback is None or callable(callback)
+    assert engine is None or isinstance(engine, str)
+    assert split_bytes is None or engine != 'pyarrow', \
+        'engine="pyarrow" is already multi-threaded, split_bytes is not supported'
 
-    df_iter = pandas.read_csv(csv_file_path, iterator=True, chunksize=100000, **pandas_kwargs)
-    df = pandas.concat(df_iter, ignore_index=True)
+    if engine == 'pyarrow':
+        df = _read_csv_pyarrow(csv_file_path, **pandas_kwargs)
+    elif split_bytes is not None:
+        df = _split_read_df([csv_file_path], pandas.read_csv, split_bytes=split_bytes,
+                            pool_size=SDConfig.cpu_count, engine=engine, **pandas_kwargs)
+    else:
+        df_iter = iter_read_df_csv(csv_file_path, engine=engine, **pandas_kwargs)
+        df = _concat_df_list(list(df_iter))
 
     if callable(callback):
         df = callback(df=df, file_path=csv_file_path)
 
-    return sd_checks.check_df(df)
+    return sd_checks.check_df(df, copy='none' if callback is None else None)
 
 
 @sd_log.log_func
+@_read_through_cache
 def read_df_json(json_file_path: str, **kwargs) -> T_DF:
     """Standard pandas json loading function."""
     assert isinstance(json_file_path, str)
 
     df = pandas.read_json(json_file_path, **kwargs)
-    return sd_checks.check_df(df)
+    return sd_checks.check_df(df, copy='none')
 
 
 @sd_log.log_func
-def read_df_fwf(fwf_file_path: str, **pandas_kwargs) -> T_DF:
-    """Standard fixed-width format reader function. Can be used for almost all fwf files"""
+@_read_through_cache
+def read_df_fwf(fwf_file_path: str, *, callback: Optional[T_CB] = None,
+                split_bytes: Optional[int] = None, **pandas_kwargs) -> T_DF:
+    """
+    Standard fixed-width format reader function. Can be used for almost all fwf files
+
+    If split_bytes is given, the file is split into byte ranges of about split_bytes at line
+    boundaries which are parsed on SDConfig.cpu_count processes
+    """
     assert isinstance(fwf_file_path, str)
+    assert callback is None or callable(callback)
 
-    # Iterative loading because python has a bug when loading giant text files
-    df_iter = pandas.read_fwf(fwf_file_path, iterator=True, chunksize=100000, **pandas_kwargs)
-    df = pandas.concat(df_iter, ignore_index=True)
-    return sd_checks.check_df(df)
+    if split_bytes is not None:
+        df = _split_read_df([fwf_file_path], pandas.read_fwf, split_bytes=split_bytes,
+                            pool_size=SDConfig.cpu_count, **pandas_kwargs)
+    else:
+        # Iterative loading because python has a bug when loading giant text files
+        df_iter = iter_read_df_fwf(fwf_file_path, **pandas_kwargs)
+        df = _concat_df_list(list(df_iter))
+
+    if callable(callback):
+        df = callback(df=df, file_path=fwf_file_path)
+
+    return sd_checks.check_df(df, copy='none' if callback is None else None)
 
 
 @sd_log.log_func
+@_read_through_cache
 def read_df_hdf(hdf_file: str, hdf_key: str, *, columns: Optional[List[str]] = None,
                 where: Optional[str] = None) -> T_DF:
     assert isinstance(hdf_file, str)
@@ -102,6 +233,7 @@ def read_df_hdf(hdf_file: str, hdf_key: str, *, columns: Optional[List[str]] = N
 
 
 @sd_log.log_func
+@_read_through_cache
 def read_df_stata(stata_file: str, callback: Optional[T_CB], **pandas_kwargs) -> T_DF:
     assert isinstance(stata_file, str)
     assert callback is None or callable(callback)
@@ -111,18 +243,20 @@ def read_df_stata(stata_file: str, callback: Optional[T_CB], **pandas_kwargs) ->
     if callable(callback):
         df = callback(df=df, file_path=stata_file)
 
-    return sd_checks.check_df(df)
+    return sd_checks.check_df(df, copy='none' if callback is None else None)
 
 
 @sd_log.log_func
+@_read_through_cache
 def read_df_dbf(dbf_file: str, **simpledbf_kwargs) -> T_DF:
     assert isinstance(dbf_file, str)
     dbf = simpledbf.Dbf5(dbf_file, **simpledbf_kwargs)
-    df = pandas.concat((df for df in dbf.to_dataframe(chunksize=10000)), ignore_index=True)
-    return sd_checks.check_df(df)
+    df = _concat_df_list(list(dbf.to_dataframe(chunksize=10000)))
+    return sd_checks.check_df(df, copy='none')
 
 
 @sd_log.log_func
+@_read_through_cache
 def read_df_geopandas(file_path, *, callback: Optional[T_CB] = None, **geopandas_kwargs) -> T_GDF:
     assert isinstance(file_path, str)
     sd_log.log(file_path)
@@ -132,10 +266,11 @@ def read_df_geopandas(file_path, *, callback: Optional[T_CB] = None, **geopandas
     if callable(callback):
         gdf = callback(df=gdf, file_path=file_path)
 
-    return sd_checks.check_gdf(gdf)
+    return sd_checks.check_gdf(gdf, copy='none' if callback is None else None)
 
 
 @sd_log.log_func
+@_read_through_cache
 def read_df_excel(file_path, *,
                   callback: Optional[T_CB] = None,
                   **pandas_kwargs) -> T_DF:
@@ -154,32 +289,99 @@ def read_df_excel(file_path, *,
 
 
 @sd_log.log_func
+@_read_through_cache
 def read_df_parquet(file_path: str,
                     columns: Optional[Iterable[str]] = None,
                     use_threads: bool = True,
                     engine: str = 'pyarrow',
+                    *,
+                    filters: Optional[List] = None,
+                    row_groups: Optional[List[int]] = None,
+                    memory_map: bool = False,
+                    categories: Optional[List[str]] = None,
+                    callback: Optional[T_CB] = None,
                     **pyarrow_kwargs) -> T_DF:
+    """
+    Parameters
+    ----------
+    file_path: str
+        Parquet file or dataset directory
+    columns: list of str
+        Columns to read
+    use_threads: bool
+    engine: str
+        'pyarrow' or 'fastparquet'
+    filters: list
+        Row filters in DNF, e.g. [('STATE', '=', 'NY'), ('YEAR', '>=', 2010)]. Row groups whose
+        statistics can't match are skipped without being read. fastparquet only skips row groups
+    row_groups: list of int
+        Only read these row groups of a single file (pyarrow only)
+    memory_map: bool
+        Memory-map the file instead of reading it into buffers (pyarrow only)
+    categories: list of str
+        Columns to keep dictionary-encoded, returned as pandas categoricals
+    callback: callable
+        Called as callback(df=df, file_path=file_path) on the loaded DataFrame
+    pyarrow_kwargs:
+        kwargs to pyarrow.parquet.read_table, or with row_groups to pyarrow.parquet.ParquetFile
+        and its read_row_groups
+    """
     assert isinstance(file_path, str), '{} does not exist'.format(file_path)
     assert os.path.exists(file_path), 'file does not exist at {}'.format(file_path)
     assert columns is None or isinstance(columns, (list, tuple))
     assert columns is None or all(isinstance(c, str) for c in columns)
     assert isinstance(use_threads, bool)
+    assert filters is None or isinstance(filters, list)
+    assert row_groups is None or all(isinstance(rg, int) for rg in row_groups)
+    assert filters is None or row_groups is None, 'Specify only one of filters and row_groups'
+    assert isinstance(memory_map, bool)
+    assert categories is None or all(isinstance(c, str) for c in categories)
+    assert callback is None or callable(callback)
 
-    extra_kwargs = {}
     if engine == 'pyarrow':
-        extra_kwargs.update(pyarrow_kwargs)
-        extra_kwargs.update({'use_threads': use_threads})
+        if row_groups is not None:
+            # read_table kwargs split between the ParquetFile and read_row_groups that take them
+            read_kwargs = {k: v for k, v in pyarrow_kwargs.items()
+                           if k in inspect.signature(pyarrow.parquet.ParquetFile.read_row_groups)
+                           .parameters}
+            file_kwargs = {k: v for k, v in pyarrow_kwargs.items() if k not in read_kwargs}
+            unsupported = set(file_kwargs) - set(
+                inspect.signature(pyarrow.parquet.ParquetFile).parameters)
+            assert len(unsupported) == 0, \
+                '{} not supported with row_groups'.format(sorted(unsupported))
+
+            parquet_file = pyarrow.parquet.ParquetFile(
+                file_path, memory_map=memory_map, read_dictionary=categories, **file_kwargs)
+            table = parquet_file.read_row_groups(
+                row_groups, columns=columns, use_threads=use_threads, **read_kwargs)
+        else:
+            table = pyarrow.parquet.read_table(
+                file_path, columns=columns, use_threads=use_threads, filters=filters,
+                memory_map=memory_map, read_dictionary=categories, **pyarrow_kwargs)
+        df = table.to_pandas(use_threads=use_threads, split_blocks=True, self_destruct=True)
+    else:
+        assert row_groups is None and not memory_map, \
+            'row_groups and memory_map need engine="pyarrow"'
 
-    df = pandas.read_parquet(
-        file_path,
-        engine=engine,
-        columns=columns,
-        **extra_kwargs)
+        extra_kwargs = {}
+        if filters is not None:
+            extra_kwargs['filters'] = filters
+        if categories is not None:
+            extra_kwargs['categories'] = categories
+
+        df = pandas.read_parquet(
+            file_path,
+            engine=engine,
+            columns=columns,
+            **extra_kwargs)
 
     # df = pyarrow.parquet.read_table(file_path, nthreads=n_threads, columns=columns,
     #                                 **pyarrow_kwargs) \
     #     .to_pandas(nthreads=n_threads)
 
+    if callable(callback):
+        df = callback(df=df, file_path=file_path)
+
     return df
 
 
@@ -197,66 +399,702 @@ def read_ddf_parquet(file_path: str,
                                        **dd_kwargs)
 
 
+# ///// Read DF - Chunked ///// #
+def iter_read_df_csv(csv_file_path: str, *, callback: Optional[T_CB] = None,
+                     chunk_bytes: int = _DEFAULT_CHUNK_BYTES, **pandas_kwargs) -> Iterator[T_DF]:
+    """
+    Generator version of read_df_csv which yields DataFrame chunks instead of concatenating them
+
+    Parameters
+    ----------
+    csv_file_path: str
+    callback: callable
+        Called as callback(df=df, file_path=csv_file_path) on each chunk before it is yielded
+    chunk_bytes: int
+        Approximate number of bytes of the csv file to parse into each chunk
+    pandas_kwargs:
+        kwargs to pandas.read_csv
+    """
+    assert isinstance(csv_file_path, str)
+    assert callback is None or callable(callback)
+    assert isinstance(chunk_bytes, int) and chunk_bytes > 0
+
+    chunksize = _chunksize_from_bytes(csv_file_path, chunk_bytes=chunk_bytes)
+    with pandas.read_csv(csv_file_path, chunksize=chunksize, **pandas_kwargs) as df_iter:
+        for df in df_iter:
+            if callable(callback):
+                df = callback(df=df, file_path=csv_file_path)
+            yield df
+
+
+def iter_read_df_fwf(fwf_file_path: str, *, callback: Optional[T_CB] = None,
+                     chunk_bytes: int = _DEFAULT_CHUNK_BYTES, **pandas_kwargs) -> Iterator[T_DF]:
+    """
+    Generator version of read_df_fwf which yields DataFrame chunks instead of concatenating them
+
+    Parameters
+    ----------
+    fwf_file_path: str
+    callback: callable
+        Called as callback(df=df, file_path=fwf_file_path) on each chunk before it is yielded
+    chunk_bytes: int
+        Approximate number of bytes of the fixed-width file to parse into each chunk
+    pandas_kwargs:
+        kwargs to pandas.read_fwf
+    """
+    assert isinstance(fwf_file_path, str)
+    assert callback is None or callable(callback)
+    assert isinstance(chunk_bytes, int) and chunk_bytes > 0
+
+    chunksize = _chunksize_from_bytes(fwf_file_path, chunk_bytes=chunk_bytes)
+    with pandas.read_fwf(fwf_file_path, chunksize=chunksize, **pandas_kwargs) as df_iter:
+        for df in df_iter:
+            if callable(callback):
+                df = callback(df=df, file_path=fwf_file_path)
+            yield df
+
+
+def _chunksize_from_bytes(file_path: str, chunk_bytes: int, sample_bytes: int = 2 ** 20) -> int:
+    """Estimates how many rows of a text file make up chunk_bytes from the first sample_bytes"""
+    # Compressed or remote files can't be sampled directly, so keep the previous row count
+    if not os.path.isfile(file_path) or \
+            os.path.splitext(file_path)[1].lower() in ('.gz', '.bz2', '.zip', '.xz', '.zst'):
+        return 100000
+
+    with open(file_path, 'rb') as f:
+        sample = f.read(sample_bytes)
+    if len(sample) == 0:
+        return 100000
+
+    n_lines = max(sample.count(b'\n'), 1)
+    return max(int(chunk_bytes // (len(sample) / n_lines)), 1)
+
+
+# Strings pandas.read_csv reads as missing values by default
+_PANDAS_NA_VALUES = frozenset(pandas._libs.parsers.STR_NA_VALUES)
+
+
+def _pyarrow_csv_options(sep: Optional[str] = None, delimiter: Optional[str] = None,
+                         header='infer', names: Optional[List[str]] = None,
+                         usecols: Optional[List[str]] = None, dtype=None, na_values=None,
+                         keep_default_na: bool = True, skiprows: int = 0, encoding: str = 'utf8',
+                         quotechar: str = '"', **pandas_kwargs) -> dict:
+    """
+    Translates the commonly used pandas.read_csv kwargs into Arrow CSV reader options, with
+    pandas' missing value strings (empty strings included) in every column
+    """
+    assert not pandas_kwargs, \
+        'Unsupported kwargs for engine="pyarrow": {}'.format(sorted(pandas_kwargs))
+    assert sep is None or delimiter is None, 'Specify only one of sep and delimiter'
+    assert header in ('infer', 0, None)
+    assert names is None or isinstance(names, (list, tuple))
+    assert usecols is None or all(isinstance(c, str) for c in usecols), \
+        'engine="pyarrow" only supports usecols as a list of column names'
+    assert isinstance(keep_default_na, bool)
+    assert isinstance(skiprows, int) and skiprows >= 0
+
+    delimiter = sep if sep is not None else delimiter
+    if header == 'infer':
+        header = None if names is not None else 0
+
+    read_options = pyarrow.csv.ReadOptions(
+        use_threads=True,
+        skip_rows=skiprows + (1 if header == 0 and names is not None else 0),
+        column_names=list(names) if names is not None else None,
+        autogenerate_column_names=header is None and names is None,
+        encoding=encoding)
+    parse_options = pyarrow.csv.ParseOptions(
+        delimiter=delimiter if delimiter is not None else ',',
+        quote_char=quotechar)
+
+    convert_kwargs = {}
+    if usecols is not None:
+        convert_kwargs['include_columns'] = list(usecols)
+    if dtype is not None:
+        if isinstance(dtype, dict):
+            convert_kwargs['column_types'] = {
+                c: _pyarrow_type_from_dtype(d) for c, d in dtype.items()}
+        else:
+            assert names is not None, \
+                'engine="pyarrow" needs names to apply a single dtype to every column'
+            convert_kwargs['column_types'] = {
+                c: _pyarrow_type_from_dtype(dtype) for c in names}
+    if isinstance(na_values, str):
+        na_values = [na_values]
+    null_values = set(na_values) if na_values is not None else set()
+    if keep_default_na:
+        null_values |= _PANDAS_NA_VALUES
+    convert_kwargs['null_values'] = sorted(null_values)
+    convert_kwargs['strings_can_be_null'] = True
+    convert_options = pyarrow.csv.ConvertOptions(**convert_kwargs)
+
+    return dict(read_options=read_options, parse_options=parse_options,
+                convert_options=convert_options)
+
+
+def _pyarrow_type_from_dtype(dtype) -> pyarrow.DataType:
+    if dtype in (str, object, 'str', 'object'):
+        return pyarrow.string()
+    return pyarrow.from_numpy_dtype(np.dtype(dtype))
+
+
+def _read_csv_pyarrow(csv_file_path: str, **pandas_kwargs) -> T_DF:
+    options = _pyarrow_csv_options(**pandas_kwargs)
+
+    # pandas leaves dates and times as text. Arrow infers the types of the columns from the
+    # first block, so read that block's schema and parse its temporal columns as strings
+    with pyarrow.csv.open_csv(csv_file_path, **options) as reader:
+        temporal_columns = [field.name for field in reader.schema
+                            if pyarrow.types.is_temporal(field.type)]
+    if temporal_columns:
+        convert_options = options['convert_options']
+        column_types = dict(convert_options.column_types)
+        column_types.update((c, pyarrow.string()) for c in temporal_columns)
+        convert_options.column_types = column_types
+
+    table = pyarrow.csv.read_csv(csv_file_path, **options)
+    string_columns = [field.name for field in table.schema
+                      if pyarrow.types.is_string(field.type) and table[field.name].null_count]
+    # split_blocks/self_destruct release the Arrow buffers column by column during conversion,
+    # so peak memory stays close to the size of the final DataFrame
+    df = table.to_pandas(split_blocks=True, self_destruct=True)
+
+    # Missing text is NaN with the pandas engine, rather than the None Arrow converts it to
+    for column in string_columns:
+        if df[column].dtype == object:
+            df[column] = df[column].where(df[column].notna(), np.nan)
+    return df
+
+
 # ///// Read DF - Multi ///// #
 def _multi_read_df_generic(paths: List[str], read_func: Callable, *,
-                           pool_size: int = SDConfig.cpu_count, callback: Optional[T_CB] = None,
-                           **pandas_kwargs) -> T_DF:
+                           pool_size: Optional[int] = None, callback: Optional[T_CB] = None,
+                           executor: Optional[str] = None, **pandas_kwargs) -> T_DF:
+    """
+    Reads every path with read_func and concatenates the results. executor is one of 'serial',
+    'threads' or 'processes', or None to pick one with _choose_executor
+    """
     assert isinstance(paths, (tuple, list))
     assert all(isinstance(p, str) for p in paths)
     assert callable(read_func)
-    assert isinstance(pool_size, int)
+    assert pool_size is None or isinstance(pool_size, int)
     assert callback is None or callable(callback)
+    assert executor in (None, 'serial', 'threads', 'processes')
+
+    if pool_size is None:
+        pool_size = SDConfig.cpu_count
 
     partial_func = functools.partial(read_func, callback=callback, **pandas_kwargs)
 
     if len(paths) == 1:
         return partial_func(paths[0])
 
-    if len(paths) == 2:
-        df = pandas.concat([partial_func(paths[0]), partial_func(paths[1])], ignore_index=True)
-        return sd_checks.check_df(df)
+    if executor is None:
+        executor = _choose_executor(paths, read_func, pool_size=pool_size, **pandas_kwargs)
+
+    df = _concat_df_list(_pool_map(partial_func, paths, pool_size=pool_size, executor=executor))
+    return sd_checks.check_df(df, copy='none')
+
+
+def _split_read_df(paths: List[str], pandas_reader: Callable, *, split_bytes: int,
+                   pool_size: Optional[int], callback: Optional[T_CB] = None,
+                   **pandas_kwargs) -> T_DF:
+    """
+    Splits each text file into byte ranges at line boundaries and parses all of the ranges on
+    one process pool. Each file is read with a single header parsed from its first lines and a
+    single set of dtypes agreed between its ranges, and its ranges are stitched back together in
+    order before the callback runs on the file.
+
+    Line boundaries are found by searching for newlines, so quoted fields containing newlines
+    are not supported.
+    """
+    assert isinstance(paths, (tuple, list))
+    assert all(isinstance(p, str) for p in paths)
+    assert pandas_reader in (pandas.read_csv, pandas.read_fwf)
+    assert isinstance(split_bytes, int) and split_bytes > 0
+    assert pool_size is None or isinstance(pool_size, int)
+    assert callback is None or callable(callback)
+    for kwarg in ('skiprows', 'skipfooter', 'nrows', 'chunksize', 'iterator', 'compression'):
+        assert kwarg not in pandas_kwargs, '{} is not supported with split_bytes'.format(kwarg)
+    assert pandas_reader is not pandas.read_fwf or \
+        pandas_kwargs.get('colspecs', 'infer') != 'infer' or 'widths' in pandas_kwargs, \
+        'read_fwf with split_bytes needs explicit colspecs or widths'
+
+    range_kwargs = {k: v for k, v in pandas_kwargs.items() if k not in ('header', 'names')}
+
+    tasks, task_file_idx = [], []
+    for file_idx, path in enumerate(paths):
+        assert os.path.splitext(path)[1].lower() not in ('.gz', '.bz2', '.zip', '.xz', '.zst'), \
+            'split_bytes needs an uncompressed file, got {}'.format(path)
+        columns, data_start = _split_header(path, pandas_reader, **pandas_kwargs)
+        for start, end in _split_byte_ranges(path, data_start, split_bytes):
+            tasks.append((path, start, end, columns))
+            task_file_idx.append(file_idx)
+
+    partial_func = functools.partial(_read_byte_range, pandas_reader=pandas_reader, **range_kwargs)
+    pool_size = SDConfig.cpu_count if pool_size is None else pool_size
+
+    df_list = _pool_map(partial_func, tasks, pool_size=pool_size, executor='processes')
+
+    # Ranges infer their dtypes independently, so settle on one dtype set per file. Columns that
+    # some ranges parsed as text are re-read as text by the others, which keeps values like
+    # zero-padded codes exactly as a single read of the file would
+    reread_idx = []
+    for file_idx in range(len(paths)):
+        file_task_idx = [i for i, idx in enumerate(task_file_idx) if idx == file_idx]
+        casts, str_columns = _shared_range_dtypes([df_list[i] for i in file_task_idx])
+        for i in file_task_idx:
+            if any(df_list[i][c].dtype != object for c in str_columns):
+                tasks[i] = tasks[i] + (str_columns,)
+                reread_idx.append(i)
+            elif casts:
+                df_list[i] = df_list[i].astype(casts)
+    if reread_idx:
+        reread_list = _pool_map(partial_func, [tasks[i] for i in reread_idx],
+                                pool_size=pool_size, executor='processes')
+        for i, df in zip(reread_idx, reread_list):
+            df_list[i] = df
+
+    df_file_list = []
+    for file_idx, path in enumerate(paths):
+        df = _concat_df_list(
+            [df_range for df_range, idx in zip(df_list, task_file_idx) if idx == file_idx])
+        if callable(callback):
+            df = callback(df=df, file_path=path)
+        df_file_list.append(df)
+
+    return _concat_df_list(df_file_list)
+
+
+def _split_header(file_path: str, pandas_reader: Callable, header='infer',
+                  names: Optional[List[str]] = None, **pandas_kwargs):
+    """Returns the shared column names and the byte offset of the first data line"""
+    if header == 'infer':
+        header = None if names is not None else 0
+    assert header is None or isinstance(header, int), \
+        'split_bytes only supports a single header line'
+
+    if names is not None:
+        columns = list(names)
+    else:
+        header_kwargs = {k: v for k, v in pandas_kwargs.items()
+                         if k not in ('usecols', 'dtype', 'converters', 'parse_dates')}
+        columns = list(pandas_reader(file_path, header=header, nrows=0, **header_kwargs).columns)
+
+    with open(file_path, 'rb') as f:
+        for _ in range(0 if header is None else header + 1):
+            f.readline()
+        data_start = f.tell()
+
+    return columns, data_start
+
+
+def _split_byte_ranges(file_path: str, start: int, split_bytes: int) -> List[tuple]:
+    """Splits [start, end of file) into ranges of about split_bytes ending on line boundaries"""
+    end = file_size(file_path)
+    bounds = [start]
+    with open(file_path, 'rb') as f:
+        while bounds[-1] + split_bytes < end:
+            # Seeking one byte back means a range that already ends on a newline is kept as is
+            f.seek(bounds[-1] + split_bytes - 1)
+            f.readline()
+            if f.tell() >= end:
+                break
+            bounds.append(f.tell())
+    bounds.append(end)
+
+    # A file without data lines still gets one (empty) range so it keeps its columns
+    return [(a, b) for a, b in zip(bounds[:-1], bounds[1:]) if b > a] or [(start, start)]
+
+
+def _shared_range_dtypes(df_list: List[T_DF]) -> tuple:
+    """
+    Dtypes the byte ranges of one file disagree on: numeric columns to cast to a common dtype,
+    and the other columns, which need to be read as text by every range
+    """
+    df_list = [df for df in df_list if len(df) > 0]
+    if len(df_list) < 2 or df_list[0].columns.has_duplicates:
+        return {}, []
+
+    casts, str_columns = {}, []
+    for column in df_list[0].columns:
+        dtypes = [df[column].dtype for df in df_list]
+        if all(dtype == dtypes[0] for dtype in dtypes[1:]):
+            continue
+        if all(isinstance(dtype, np.dtype) and dtype.kind in 'iuf' for dtype in dtypes):
+            casts[column] = np.result_type(*dtypes)
+        else:
+            str_columns.append(column)
+
+    return casts, str_columns
 
-    with multiprocessing.Pool(pool_size) as pool:
-        df_list = pool.map(partial_func, paths, chunksize=1)
-        df = pandas.concat(df_list, ignore_index=True)
 
-        return sd_checks.check_df(df)
+def _read_byte_range(task: tuple, pandas_reader: Callable, **pandas_kwargs) -> T_DF:
+    """
+    Parses a byte range task of (path, start, end, columns), or of
+    (path, start, end, columns, str_columns) to read str_columns as text
+    """
+    file_path, start, end, columns = task[:4]
+    if len(task) > 4:
+        pandas_kwargs['dtype'] = {**(pandas_kwargs.get('dtype') or {}),
+                                  **{column: str for column in task[4]}}
+    if end == start:
+        df = pandas.DataFrame(columns=columns)
+        usecols = pandas_kwargs.get('usecols')
+        return df if usecols is None or callable(usecols) else df.iloc[:, [
+            c if isinstance(c, int) else columns.index(c) for c in usecols]]
+
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        buffer = BytesIO(f.read(end - start))
+
+    return pandas_reader(buffer, header=None, names=columns, **pandas_kwargs)
 
 
 def _multi_joblib_read_df_generic(paths: List[str], read_func: Callable,
                                   kwargs_dict_list: List[dict], *,
-                                  pool_size: int = SDConfig.cpu_count,
+                                  pool_size: Optional[int] = None,
                                   callback: Optional[T_CB] = None, **pandas_kwargs) -> T_DF:
     assert isinstance(paths, (tuple, list))
     assert all(isinstance(p, str) for p in paths)
     assert callable(read_func)
     assert isinstance(kwargs_dict_list, (tuple, list))
     assert all(isinstance(d, dict) for d in kwargs_dict_list)
-    assert isinstance(pool_size, int)
+    assert pool_size is None or isinstance(pool_size, int)
     assert callback is None or callable(callback)
     assert len(paths) == len(kwargs_dict_list)
 
+    if pool_size is None:
+        pool_size = SDConfig.cpu_count
+
     partial_func = functools.partial(read_func, callback=callback, **pandas_kwargs)
 
     if len(paths) == 1:
         return partial_func(paths[0], **kwargs_dict_list[0])
 
-    df_list = joblib.Parallel(pool_size)(
-        joblib.delayed(partial_func)(p, **d) for p, d in zip(paths, kwargs_dict_list))
-    df = pandas.concat(df_list, ignore_index=True)
-    return sd_checks.check_df(df)
+    # Traced like _pool_map, with the workers' SDLog events sent back with each result
+    traced = sd_trace.is_tracing()
+    with _worker_transport() as transport_func:
+        worker_func = functools.partial(_call_with_kwargs, transport_func(partial_func))
+        if traced:
+            worker_func = functools.partial(sd_trace._call_traced, func=worker_func)
+        result_list = joblib.Parallel(pool_size)(
+            joblib.delayed(worker_func)((p, d)) for p, d in zip(paths, kwargs_dict_list))
+        if traced:
+            for _, events in result_list:
+                sd_trace._merge(events)
+            result_list = [r for r, _ in result_list]
+        df = _concat_df_list([_receive_df(r) for r in result_list])
+
+    return sd_checks.check_df(df, copy='none')
+
+
+def _call_with_kwargs(func: Callable, item: tuple):
+    """func(path, **kwargs) for an item (path, kwargs)"""
+    path, kwargs = item
+    return func(path, **kwargs)
+
+
+# ///// Concatenation ///// #
+def _concat_df_list(df_list: List[T_DF]) -> T_DF:
+    """
+    Equivalent of pandas.concat(df_list, ignore_index=True) which allocates each numpy column of
+    the result once, from the row counts and dtypes of the parts, and fills it part by part.
+    Parts are released from df_list as soon as they are copied, so peak memory stays close to the
+    size of the result, and the filled arrays are handed to the result without consolidating them
+    into blocks (another copy). Columns with extension dtypes are concatenated by pandas, and
+    lists of parts with mismatched columns (or anything but plain DataFrames) fall back to
+    pandas.concat. A single part is returned as a shallow copy with a new index.
+    """
+    assert isinstance(df_list, list)
+
+    if len(df_list) == 0 or any(type(df) is not pandas.DataFrame for df in df_list):
+        return pandas.concat(df_list, ignore_index=True)
+
+    columns = df_list[0].columns
+    if columns.has_duplicates or any(not df.columns.equals(columns) for df in df_list[1:]):
+        return pandas.concat(df_list, ignore_index=True)
+
+    if len(df_list) == 1:
+        df = df_list.pop().copy(deep=False)
+        df.index = pandas.RangeIndex(len(df))
+        return df
+
+    n_rows = sum(len(df) for df in df_list)
+    dtypes = [_common_numpy_dtype([df.dtypes.iloc[idx] for df in df_list])
+              for idx in range(len(columns))]
+    preallocated = [idx for idx, dtype in enumerate(dtypes) if dtype is not None]
+    delegated = [idx for idx, dtype in enumerate(dtypes) if dtype is None]
+
+    column_arrays = {}
+    if len(delegated) > 0:
+        df_delegated = pandas.concat(
+            [df.iloc[:, delegated] for df in df_list], ignore_index=True)
+        column_arrays.update(
+            (idx, df_delegated.iloc[:, position]) for position, idx in enumerate(delegated))
+        del df_delegated
+
+    numpy_arrays = {idx: np.empty(n_rows, dtype=dtypes[idx]) for idx in preallocated}
+    start = 0
+    for part_idx in range(len(df_list)):
+        df, df_list[part_idx] = df_list[part_idx], None
+        stop = start + len(df)
+        for idx, arr in numpy_arrays.items():
+            arr[start:stop] = df.iloc[:, idx].to_numpy()
+        start = stop
+        del df
+    # As Series of the arrays' own dtypes, so object columns of strings aren't inferred as text
+    index = pandas.RangeIndex(n_rows)
+    column_arrays.update(
+        (idx, pandas.Series(arr, index=index, dtype=arr.dtype, copy=False))
+        for idx, arr in numpy_arrays.items())
+    del numpy_arrays
+
+    # Positional keys, so the columns keep their order (and labels pandas can't use as keys)
+    df_concat = pandas.DataFrame(
+        {position: column_arrays.pop(position) for position in range(len(columns))},
+        copy=False)
+    df_concat.columns = columns
+    return df_concat
+
+
+def _common_numpy_dtype(dtypes: List) -> Optional[np.dtype]:
+    """
+    The numpy dtype pandas.concat gives a column made of these dtypes. None if any of them is an
+    extension dtype, or if mixing them follows pandas-specific rules (booleans, datetimes, objects)
+    """
+    if not all(isinstance(d, np.dtype) for d in dtypes):
+        return None
+
+    dtypes = set(dtypes)
+    if len(dtypes) == 1:
+        return dtypes.pop()
+    if all(d.kind in 'iuf' for d in dtypes):
+        return np.result_type(*dtypes)
+
+    return None
+
+
+# ///// Worker pools ///// #
+_process_pools = {}
+_thread_pools = {}
+
+
+def _choose_executor(paths: List[str], read_func: Callable, *, pool_size: int,
+                     **pandas_kwargs) -> str:
+    """
+    Picks how to run a multi read:
+        'serial' for a single worker or small total file sizes, where pool overhead dominates
+        'threads' for readers whose parsing releases the GIL (pyarrow csv, parquet)
+        'processes' otherwise
+    """
+    if pool_size == 1 or len(paths) <= 1:
+        return 'serial'
+    if all(os.path.isfile(p) for p in paths) and \
+            sum(file_size(p) for p in paths) < _SERIAL_MAX_BYTES:
+        return 'serial'
+
+    if read_func is read_df_parquet and pandas_kwargs.get('engine', 'pyarrow') == 'pyarrow':
+        return 'threads'
+    if read_func is read_df_csv and pandas_kwargs.get('engine') == 'pyarrow':
+        return 'threads'
+
+    return 'processes'
+
+
+def _pool_map(func: Callable, items: List, *, pool_size: int, executor: str) -> List:
+    """Maps func over items in order with the given executor"""
+    assert executor in ('serial', 'threads', 'processes')
+
+    if executor == 'serial' or len(items) <= 1:
+        return [func(item) for item in items]
+
+    pool_size = min(pool_size, len(items))
+    if executor == 'threads':
+        with _worker_pool('threads', pool_size) as pool:
+            return list(pool.map(func, items))
+
+    # While tracing, workers send their SDLog events back with each result to be merged
+    traced = sd_trace.is_tracing()
+    with _worker_transport() as transport_func, _worker_pool('processes', pool_size) as pool:
+        worker_func = transport_func(func)
+        if traced:
+            worker_func = functools.partial(sd_trace._call_traced, func=worker_func)
+        result_list = pool.map(worker_func, items, chunksize=1)
+        if traced:
+            for _, events in result_list:
+                sd_trace._merge(events)
+            result_list = [r for r, _ in result_list]
+        return [_receive_df(r) for r in result_list]
+
+
+@contextlib.contextmanager
+def _worker_pool(executor: str, pool_size: int):
+    """
+    Yields a thread or process pool of pool_size workers. With SDConfig.persistent_pool the pool
+    is created once and kept warm for later multi reads, otherwise it is shut down on exit
+    """
+    if not SDConfig.persistent_pool:
+        pool = _new_worker_pool(executor, pool_size)
+        try:
+            yield pool
+        finally:
+            _shutdown_worker_pool(pool)
+        return
+
+    pools = _thread_pools if executor == 'threads' else _process_pools
+    if pool_size not in pools:
+        pools[pool_size] = _new_worker_pool(executor, pool_size)
+    yield pools[pool_size]
+
+
+def _new_worker_pool(executor: str, pool_size: int):
+    if executor == 'threads':
+        return ThreadPoolExecutor(pool_size)
+    return multiprocessing.Pool(pool_size, initializer=_warm_worker)
+
+
+def _shutdown_worker_pool(pool) -> None:
+    if isinstance(pool, ThreadPoolExecutor):
+        pool.shutdown(wait=True)
+    else:
+        pool.terminate()
+        pool.join()
+
+
+def _warm_worker() -> None:
+    """Imports the heavy reader dependencies once per worker process instead of once per task"""
+    for module in ('sd_utils.sd_load', 'dask.dataframe', 'geopandas', 'pyarrow.parquet'):
+        importlib.import_module(module)
+
+
+@atexit.register
+def shutdown_worker_pools() -> None:
+    """Shuts down the warm worker pools kept by SDConfig.persistent_pool"""
+    for pools in (_process_pools, _thread_pools):
+        while len(pools) > 0:
+            _, pool = pools.popitem()
+            _shutdown_worker_pool(pool)
+
+
+# ///// Worker result transport ///// #
+@contextlib.contextmanager
+def _worker_transport() -> Iterator[Callable[[Callable], Callable]]:
+    """
+    Context for returning DataFrames from worker processes. Yields a function which wraps a
+    worker function so its result comes back as described by SDConfig.multi_read_transport:
+        'arrow': the worker writes an Arrow IPC file to a scratch directory and returns its path,
+            which _receive_df memory-maps and converts to pandas. Numeric columns convert
+            without a pickle round trip, but text columns are still copied into Python objects.
+            Frames which Arrow can't represent with the same dtypes (e.g. GeoDataFrames or object
+            columns of numbers) fall back to pickling
+        'pickle': the DataFrame is pickled back to the parent process
+    """
+    if SDConfig.multi_read_transport == 'pickle':
+        yield lambda func: func
+        return
+
+    with tempfile.TemporaryDirectory(prefix='sd_utils_ipc_', dir=SDConfig.scratch_dir) as ipc_dir:
+        yield lambda func: functools.partial(_call_to_arrow_ipc, func=func, ipc_dir=ipc_dir)
+
+
+# Schema metadata key listing the object columns whose missing values were NaN in the worker
+_NAN_COLUMNS_KEY = b'sd_utils_nan_columns'
+
+
+def _call_to_arrow_ipc(*args, func: Callable, ipc_dir: str, **kwargs):
+    df = func(*args, **kwargs)
+    if type(df) is not pandas.DataFrame or df.columns.has_duplicates or \
+            not all(isinstance(column, str) for column in df.columns):
+        return df
+
+    try:
+        # The index is dropped because every multi reader concatenates with ignore_index=True
+        table = pyarrow.Table.from_pandas(df, preserve_index=False)
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError, pyarrow.ArrowNotImplementedError):
+        return df
+
+    # Object columns Arrow converts to another type (e.g. of python ints) would come back with a
+    # different dtype, and Arrow keeps one kind of null, so frames with those or with missing
+    # values other than all NaN or all None in an object column are pickled instead
+    nan_columns = []
+    for column, field in zip(df.columns, table.schema):
+        if df[column].dtype != object:
+            continue
+        if not (pyarrow.types.is_string(field.type) or pyarrow.types.is_large_string(field.type)
+                or pyarrow.types.is_binary(field.type) or pyarrow.types.is_null(field.type)):
+            return df
+        values = df[column].to_numpy()
+        missing_types = {type(v) for v in values[pandas.isna(values)]}
+        if missing_types == {float}:
+            nan_columns.append(column)
+        elif missing_types - {type(None)}:
+            return df
+    if nan_columns:
+        metadata = dict(table.schema.metadata or {})
+        metadata[_NAN_COLUMNS_KEY] = json.dumps(nan_columns)
+        table = table.replace_schema_metadata(metadata)
+
+    ipc_file_path = os.path.join(ipc_dir, '{}.arrow'.format(uuid.uuid4().hex))
+    with pyarrow.OSFile(ipc_file_path, 'wb') as sink:
+        with pyarrow.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+    return ipc_file_path
+
+
+def _receive_df(result) -> T_DF:
+    """Maps an Arrow IPC file written by _call_to_arrow_ipc, or returns a pickled result as is"""
+    if not isinstance(result, str):
+        return result
+
+    table = pyarrow.ipc.open_file(pyarrow.memory_map(result, 'r')).read_all()
+    # The mapping stays valid after the file is unlinked, so the scratch space is freed once the
+    # DataFrame no longer references it
+    os.remove(result)
+
+    # Text columns that were object in the worker are converted to object arrays themselves, so
+    # they keep their dtype and missing values whatever string dtype pandas would default to
+    column_names = table.column_names
+    object_arrays = {
+        column['name']: table.column(column['name']).to_numpy(zero_copy_only=False)
+        for column in (table.schema.pandas_metadata or {}).get('columns', [])
+        if column['numpy_type'] == 'object' and column['name'] in column_names}
+
+    nan_columns = set(json.loads((table.schema.metadata or {}).get(_NAN_COLUMNS_KEY, b'[]')))
+    if object_arrays:
+        table = table.select([c for c in column_names if c not in object_arrays])
+
+    # Columns converted without a copy would be read-only views of the mapped file, so they are
+    # copied into memory the caller can write to
+    df = table.to_pandas(split_blocks=True, self_destruct=True).copy(deep=True)
+    del table
+    for loc, column in enumerate(column_names):
+        if column in object_arrays:
+            values = object_arrays.pop(column)
+            if column in nan_columns:
+                # Missing values that were NaN in the worker rather than None
+                values[pandas.isna(values)] = np.nan
+            df.insert(loc, column, pandas.Series(values, index=df.index, dtype=object))
+    return df
 
 
 @sd_log.log_func
-def multi_read_df_csv(paths: List[str], *, pool_size: int = SDConfig.cpu_count,
-                      callback: Optional[T_CB] = None, **pandas_kwargs) -> T_DF:
+def multi_read_df_csv(paths: List[str], *, pool_size: Optional[int] = None,
+                      callback: Optional[T_CB] = None, split_bytes: Optional[int] = None,
+                      executor: Optional[str] = None, **pandas_kwargs) -> T_DF:
+    if split_bytes is not None:
+        df = _split_read_df(paths, pandas.read_csv, split_bytes=split_bytes,
+                            pool_size=pool_size, callback=callback, **pandas_kwargs)
+        return sd_checks.check_df(df, copy='none')
+
     return _multi_read_df_generic(paths, read_func=read_df_csv, pool_size=pool_size,
-                                  callback=callback, **pandas_kwargs)
+                                  callback=callback, executor=executor, **pandas_kwargs)
 
 
 @sd_log.log_func
 def multi_joblib_read_df_csv(paths: List[str], kwargs_dict_list: List[dict], *,
-                             pool_size: int = SDConfig.cpu_count,
+                             pool_size: Optional[int] = None,
                              callback: Optional[T_CB] = None, **pandas_kwargs) -> T_DF:
     return _multi_joblib_read_df_generic(
         paths, read_func=read_df_csv, kwargs_dict_list=kwargs_dict_list,
@@ -264,32 +1102,49 @@ def multi_joblib_read_df_csv(paths: List[str], kwargs_dict_list: List[dict], *,
 
 
 @sd_log.log_func
-def multi_read_df_fwf(paths: List[str], *, pool_size: int = SDConfig.cpu_count,
-                      callback: Optional[T_CB] = None, **pandas_kwargs) -> T_DF:
+def multi_read_df_fwf(paths: List[str], *, pool_size: Optional[int] = None,
+                      callback: Optional[T_CB] = None, split_bytes: Optional[int] = None,
+                      executor: Optional[str] = None, **pandas_kwargs) -> T_DF:
+    if split_bytes is not None:
+        df = _split_read_df(paths, pandas.read_fwf, split_bytes=split_bytes,
+                            pool_size=pool_size, callback=callback, **pandas_kwargs)
+        return sd_checks.check_df(df, copy='none')
+
     return _multi_read_df_generic(paths, read_func=read_df_fwf, pool_size=pool_size,
-                                  callback=callback, **pandas_kwargs)
+                                  callback=callback, executor=executor, **pandas_kwargs)
 
 
 @sd_log.log_func
-def multi_read_df_geopandas(paths: List[str], *, pool_size: int = SDConfig.cpu_count,
-                            callback: Optional[T_CB] = None, **geopandas_kwargs) -> T_GDF:
+def multi_read_df_geopandas(paths: List[str], *, pool_size: Optional[int] = None,
+                            callback: Optional[T_CB] = None, executor: Optional[str] = None,
+                            **geopandas_kwargs) -> T_GDF:
     df = _multi_read_df_generic(paths, read_func=read_df_geopandas, pool_size=pool_size,
-                                callback=callback, **geopandas_kwargs)
-    return sd_checks.check_gdf(df)
+                                callback=callback, executor=executor, **geopandas_kwargs)
+    return sd_checks.check_gdf(df, copy='none')
 
 
 @sd_log.log_func
-def multi_read_df_excel(paths: List[str], *, pool_size: int = SDConfig.cpu_count,
-                        callback: Optional[T_CB] = None, **pandas_kwargs) -> T_DF:
+def multi_read_df_excel(paths: List[str], *, pool_size: Optional[int] = None,
+                        callback: Optional[T_CB] = None, executor: Optional[str] = None,
+                        **pandas_kwargs) -> T_DF:
     return _multi_read_df_generic(paths, read_func=read_df_excel, pool_size=pool_size,
-                                  callback=callback, **pandas_kwargs)
+                                  callback=callback, executor=executor, **pandas_kwargs)
 
 
 @sd_log.log_func
-def multi_read_df_stata(paths: List[str], *, pool_size: int = SDConfig.cpu_count,
-                        callback: Optional[T_CB] = None, **pandas_kwargs) -> T_DF:
+def multi_read_df_stata(paths: List[str], *, pool_size: Optional[int] = None,
+                        callback: Optional[T_CB] = None, executor: Optional[str] = None,
+                        **pandas_kwargs) -> T_DF:
     return _multi_read_df_generic(paths, read_func=read_df_stata, pool_size=pool_size,
-                                  callback=callback, **pandas_kwargs)
+                                  callback=callback, executor=executor, **pandas_kwargs)
+
+
+@sd_log.log_func
+def multi_read_df_parquet(paths: List[str], *, pool_size: Optional[int] = None,
+                          callback: Optional[T_CB] = None, executor: Optional[str] = None,
+                          **pyarrow_kwargs) -> T_DF:
+    return _multi_read_df_generic(paths, read_func=read_df_parquet, pool_size=pool_size,
+                                  callback=callback, executor=executor, **pyarrow_kwargs)
 
 
 # ///// Write DF///// #
@@ -361,10 +1216,57 @@ def write_df_hdf(df: T_DF, hdf_file: str, hdf_key: str, *,
 @sd_log.log_func
 def write_df_parquet(df: T_DF, file_path: str, chunk_size: int = 50000,
                      version: str = '2.0', index: bool = True, engine: str = 'pyarrow',
+                     *,
+                     partition_cols: Optional[List[str]] = None,
+                     row_group_bytes: Optional[int] = None,
+                     overwrite: bool = False,
                      **pyarrow_kwargs) -> None:
+    """
+    Parameters
+    ----------
+    df: pandas.DataFrame
+    file_path: str
+        Parquet file, or dataset directory if partition_cols is given
+    chunk_size: int
+        Number of rows per row group
+    version: str
+        Parquet format version
+    index: bool
+        Write the index of df
+    engine: str
+        'pyarrow' or 'fastparquet'
+    partition_cols: list of str
+        Write a hive-style partitioned dataset (file_path/COL=value/part-0.parquet) with one
+        file per partition, written on SDConfig.cpu_count threads, plus _metadata and
+        _common_metadata summary files (pyarrow only). Values are percent-encoded in the paths
+        as pyarrow.dataset does
+    row_group_bytes: int
+        Size row groups to about this many bytes of in-memory data instead of using chunk_size
+    overwrite: bool
+        With partition_cols, replace a dataset already at file_path by removing its partition
+        directories and summary files first (anything else in the directory is left). Without
+        it, a non-empty directory at file_path raises a FileExistsError
+    pyarrow_kwargs:
+        kwargs to pyarrow.parquet.write_table (or the fastparquet writer)
+    """
     assert isinstance(file_path, str)
     assert isinstance(chunk_size, int) and chunk_size > 0
     assert all(isinstance(c, str) for c in df.columns)
+    assert partition_cols is None or \
+        (isinstance(partition_cols, list) and all(c in df.columns for c in partition_cols))
+    assert partition_cols is None or engine == 'pyarrow', 'partition_cols needs engine="pyarrow"'
+    assert row_group_bytes is None or (isinstance(row_group_bytes, int) and row_group_bytes > 0)
+    assert isinstance(overwrite, bool)
+
+    if row_group_bytes is not None:
+        bytes_per_row = df.memory_usage(index=index, deep=True).sum() / max(len(df), 1)
+        chunk_size = max(int(row_group_bytes // max(bytes_per_row, 1)), 1)
+
+    if partition_cols is not None:
+        _write_parquet_dataset(df, file_path, partition_cols=partition_cols,
+                               row_group_size=chunk_size, version=version, index=index,
+                               overwrite=overwrite, **pyarrow_kwargs)
+        return
 
     if not index:
         df = df.reset_index(drop=True)
@@ -376,7 +1278,8 @@ def write_df_parquet(df: T_DF, file_path: str, chunk_size: int = 50000,
     df.to_parquet(
         file_path,
         engine=engine,
-        **extra_kwargs)
+        **extra_kwargs,
+        **pyarrow_kwargs)
 
     # noinspection PyArgumentList
     # df_arrow = pyarrow.Table.from_pandas(df)
@@ -384,30 +1287,217 @@ def write_df_parquet(df: T_DF, file_path: str, chunk_size: int = 50000,
     #     df_arrow, file_path, chunk_size=chunk_size, version=version, **kwargs)
 
 
+def _write_parquet_dataset(df: T_DF, dir_path: str, *, partition_cols: List[str],
+                           row_group_size: int, version: str, index: bool, overwrite: bool,
+                           **pyarrow_kwargs) -> None:
+    # Every partition is written with the schema of the whole frame, so the files and the
+    # _metadata summary agree even when a partition has e.g. only nulls in a column
+    schema = pyarrow.Schema.from_pandas(df.drop(columns=partition_cols), preserve_index=index)
+    partitions = df.groupby(partition_cols, sort=False, dropna=False, observed=True).indices
+
+    def write_partition(partition_key) -> pyarrow.parquet.FileMetaData:
+        values = partition_key if isinstance(partition_key, tuple) else (partition_key,)
+        relative_path = '/'.join(
+            ['{}={}'.format(c, '__HIVE_DEFAULT_PARTITION__' if pandas.isnull(v)
+                            else urllib.parse.quote(str(v), safe=''))
+             for c, v in zip(partition_cols, values)] + ['part-0.parquet'])
+        partition_file_path = os.path.join(dir_path, *relative_path.split('/'))
+        os.makedirs(os.path.dirname(partition_file_path), exist_ok=True)
+
+        df_partition = df.iloc[partitions[partition_key]].drop(columns=partition_cols)
+        table = pyarrow.Table.from_pandas(df_partition, schema=schema, preserve_index=index)
+        metadata_collector = []
+        pyarrow.parquet.write_table(table, partition_file_path, row_group_size=row_group_size,
+                                    version=version, metadata_collector=metadata_collector,
+                                    **pyarrow_kwargs)
+
+        metadata = metadata_collector[0]
+        metadata.set_file_path(relative_path)
+        return metadata
+
+    if os.path.isdir(dir_path) and os.listdir(dir_path):
+        if not overwrite:
+            raise FileExistsError(
+                '{} is not empty, pass overwrite=True to replace the dataset in it'.format(
+                    dir_path))
+        # Only what this writer produces, so partitions of an earlier write don't stay in the
+        # dataset and nothing else is deleted
+        for name in os.listdir(dir_path):
+            path = os.path.join(dir_path, name)
+            if name in ('_metadata', '_common_metadata') and os.path.isfile(path):
+                os.remove(path)
+            elif name.startswith(partition_cols[0] + '=') and os.path.isdir(path):
+                shutil.rmtree(path)
+    os.makedirs(dir_path, exist_ok=True)
+    with ThreadPoolExecutor(SDConfig.cpu_count) as pool:
+        metadata_list = list(pool.map(write_partition, list(partitions)))
+
+    pyarrow.parquet.write_metadata(schema, os.path.join(dir_path, '_common_metadata'))
+    pyarrow.parquet.write_metadata(schema, os.path.join(dir_path, '_metadata'),
+                                   metadata_collector=metadata_list)
+
+
 @sd_log.log_func
 def write_ddf_parquet(ddf: T_DDF, file_path: str, **dd_kwargs) -> None:
     assert isinstance(file_path, str)
     assert all(isinstance(c, str) for c in ddf.columns)
     assert isinstance(ddf, dask.dataframe.DataFrame)
 
-    ddf.to_parquet(path=file_path, **dd_kwargs)
+    with sd_ddf._job_scheduler():
+        ddf.to_parquet(path=file_path, **dd_kwargs)
 
 
 # ///// xarray - read ///// #
 @sd_log.log_func
-def read_xds_netcdf(file_path: str, **xarray_kwargs) -> xarray.Dataset:
+def read_xds_netcdf(file_path: str, *, chunks=None, **xarray_kwargs) -> xarray.Dataset:
+    """
+    Parameters
+    ----------
+    file_path: str
+    chunks: int, dict or str
+        Open the variables lazily as dask arrays with these chunks, e.g. {'YEAR': 1} or 'auto',
+        so they are read chunk by chunk as they are computed
+    xarray_kwargs
+        Other keyword arguments for xarray.open_dataset
+    """
     assert isinstance(file_path, str)
-    xds = xarray.open_dataset(file_path, **xarray_kwargs)
+    xds = xarray.open_dataset(file_path, chunks=chunks, **xarray_kwargs)
+    assert isinstance(xds, xarray.Dataset)
+    return xds
+
+
+@sd_log.log_func
+def read_xds_mfnetcdf(file_paths: Union[str, List[str]], concat_dim: str, *, chunks=None,
+                      parallel: bool = True, **xarray_kwargs) -> xarray.Dataset:
+    """
+    Lazily opens several NetCDF files as one Dataset, concatenated along concat_dim in the order
+    of file_paths
+
+    Parameters
+    ----------
+    file_paths: str or list
+        Paths of the files, or a glob of them (sorted)
+    concat_dim: str
+        Dimension to concatenate along, e.g. 'YEAR'. A new dimension if the files don't have it
+    chunks: int, dict or str
+        dask chunks of each file. By default at least one chunk per file
+    parallel: bool
+        Open the files and read their metadata in parallel with dask
+    xarray_kwargs
+        Other keyword arguments for xarray.open_mfdataset
+    """
+    assert isinstance(file_paths, str) or (
+        isinstance(file_paths, list) and all(isinstance(p, str) for p in file_paths))
+    assert isinstance(concat_dim, str)
+    assert isinstance(parallel, bool)
+
+    xds = xarray.open_mfdataset(
+        file_paths, combine='nested', concat_dim=concat_dim,
+        chunks={} if chunks is None else chunks, parallel=parallel, **xarray_kwargs)
+    assert isinstance(xds, xarray.Dataset)
+    return xds
+
+
+@sd_log.log_func
+def read_xds_zarr(store: str, *, chunks='auto', **xarray_kwargs) -> xarray.Dataset:
+    """
+    Lazily opens a Zarr store as a Dataset of dask arrays
+
+    Parameters
+    ----------
+    store: str
+        Path of the Zarr store
+    chunks: int, dict or str
+        dask chunks of the variables. 'auto' uses multiples of the chunks of the store,
+        None opens them without dask
+    xarray_kwargs
+        Other keyword arguments for xarray.open_zarr
+    """
+    assert isinstance(store, str)
+    xds = xarray.open_zarr(store, chunks=chunks, **xarray_kwargs)
     assert isinstance(xds, xarray.Dataset)
     return xds
 
 
 # /// xarray - writer /// #
 @sd_log.log_func
-def write_xds_netcdf(xds: xarray.Dataset, file_path: str, **xarray_kwargs) -> None:
+def write_xds_netcdf(xds: xarray.Dataset, file_path: str, *, complevel: Optional[int] = None,
+                     chunks=None, **xarray_kwargs) -> None:
+    """
+    Writes xds to a NetCDF file. dask-backed variables are written chunk by chunk, so xds
+    doesn't have to fit in memory
+
+    Parameters
+    ----------
+    xds: xarray.Dataset
+    file_path: str
+    complevel: int
+        zlib compression level (1-9) of the numeric variables. Their NetCDF chunks follow their
+        dask chunks. Needs the netCDF4 or h5netcdf engine
+    chunks: int, dict or str
+        Rechunk xds with dask before writing
+    xarray_kwargs
+        Other keyword arguments for xarray.Dataset.to_netcdf. Entries of encoding take
+        precedence over the ones from complevel
+    """
     assert isinstance(xds, xarray.Dataset)
     assert isinstance(file_path, str)
-    xds.to_netcdf(file_path, **xarray_kwargs)
+    assert complevel is None or (isinstance(complevel, int) and 0 <= complevel <= 9)
+
+    if chunks is not None:
+        xds = _rechunk_xds(xds, chunks)
+
+    if complevel is not None:
+        encoding = {}
+        for name, xda in xds.data_vars.items():
+            if xda.dtype.kind not in 'biuf':
+                continue
+            encoding[name] = {'zlib': True, 'complevel': complevel}
+            if xda.chunks is not None:
+                encoding[name]['chunksizes'] = tuple(c[0] for c in xda.chunks)
+        for name, var_encoding in xarray_kwargs.pop('encoding', {}).items():
+            encoding[name] = dict(encoding.get(name, {}), **var_encoding)
+        xarray_kwargs['encoding'] = encoding
+
+    with sd_ddf._job_scheduler():
+        xds.to_netcdf(file_path, **xarray_kwargs)
+
+
+@sd_log.log_func
+def write_xds_zarr(xds: xarray.Dataset, store: str, *, chunks=None, **xarray_kwargs) -> None:
+    """
+    Writes xds to a Zarr store (compressed by Zarr's default compressor), chunk by chunk for
+    dask-backed variables
+
+    Parameters
+    ----------
+    xds: xarray.Dataset
+    store: str
+        Path of the Zarr store
+    chunks: int, dict or str
+        Rechunk xds with dask before writing. The Zarr chunks follow the dask chunks
+    xarray_kwargs
+        Other keyword arguments for xarray.Dataset.to_zarr, e.g. mode='w' to overwrite
+    """
+    assert isinstance(xds, xarray.Dataset)
+    assert isinstance(store, str)
+
+    if chunks is not None:
+        xds = _rechunk_xds(xds, chunks)
+
+    with sd_ddf._job_scheduler():
+        xds.to_zarr(store, **xarray_kwargs)
+
+
+# /// Internal only /// #
+def _rechunk_xds(xds: xarray.Dataset, chunks) -> xarray.Dataset:
+    """xds rechunked, dropping the chunks encoded from its source so they don't conflict"""
+    xds = xds.chunk(chunks)
+    for xda in xds.variables.values():
+        xda.encoding.pop('chunks', None)
+        xda.encoding.pop('chunksizes', None)
+        xda.encoding.pop('preferred_chunks', None)
+    return xds
 
 
 # ///// Other ///// #
@@ -11,30 +11,55 @@ December 12, 2016
 StratoDem Analytics, LLC
 """
 
+import atexit
+import contextvars
 import datetime
 import functools
+import inspect
+import os
+import queue
+import threading
 import time
 import traceback
-from typing import Callable, Any, Optional, List, Union
+import warnings
+from typing import Callable, Any, Dict, Optional, List, Tuple, Union
 
 from slack import WebClient
 
+from sd_utils import sd_metrics, sd_trace
 from sd_utils.sd_config import SDConfig
 
-__all__ = ['SDLog', 'log', 'log_func', 'log_gen']
+__all__ = ['SDLog', 'log', 'log_func', 'log_gen', 'flush_logs']
+
+
+# Stack of entered SDLog contexts. A context variable, so each thread and each asyncio task
+# nests its own contexts (tasks start from the stack of the code that created them)
+_contexts = contextvars.ContextVar('sd_log_contexts', default=())  # type: contextvars.ContextVar
+
+
+class _DeprecatedContexts:
+    """Read-only SDLog.contexts, the list of contexts before SDLog.current_contexts replaced it"""
+    def __get__(self, instance, owner) -> List['SDLog']:
+        warnings.warn('SDLog.contexts is deprecated, use SDLog.current_contexts()',
+                      DeprecationWarning, stacklevel=2)
+        return list(_contexts.get())
+
+    def __set__(self, instance, value) -> None:
+        raise AttributeError('SDLog.contexts is read-only')
 
 
 class SDLog:
-    contexts = []  # type: List[SDLog]
     # /// #
     set_timer = True
     # /// #
     special_char = '-'
     break_char = '|'
+    contexts = _DeprecatedContexts()
 
     def __init__(self, message: str = '', timer: Optional[bool] = None, slack: bool = False,
                  block: bool = False,
-                 max_expected_time: Optional[Union[int, float]] = None) -> None:
+                 max_expected_time: Optional[Union[int, float]] = None,
+                 metric_name: Optional[str] = None) -> None:
         """
         SDLog which logs context on entrance and exit
 
@@ -49,6 +74,10 @@ class SDLog:
         block: bool
         max_expected_time: int or float
             Number of seconds that the function can run without adding a warning during __exit__
+        metric_name: str
+            Name to record the context's duration and memory use under in sd_metrics. Contexts
+            without one aren't recorded, so messages with e.g. a file name in them don't add a
+            metric each. log_func uses the module and qualname of the function
         """
         timer = self.set_timer if timer is None else timer
         assert isinstance(message, str)
@@ -56,14 +85,21 @@ class SDLog:
         assert isinstance(slack, bool)
         assert isinstance(block, bool)
         assert max_expected_time is None or isinstance(max_expected_time, (int, float))
+        assert metric_name is None or isinstance(metric_name, str)
 
         self.main_msg = message
         self.timer = timer
         self.slack = slack
         self.block = block
         self.max_expected_time = max_expected_time
+        self.metric_name = metric_name
 
         self.start_time = None
+        self._contexts_token = None
+        self._perf_start = None
+        self._rss_start = None
+        self._traced_start = None
+        self._trace_start = None
 
     def __enter__(self) -> 'SDLog':
         self.log_message('{context_buffer}Start : {main_msg}'.format(
@@ -73,13 +109,24 @@ class SDLog:
             self.log_message('{context_buffer}[ Slack ]'.format(
                 context_buffer=self._context_buffer_str()))
 
-        self.contexts.append(self)
+        self._contexts_token = _contexts.set(_contexts.get() + (self,))
+        self._trace_start = sd_trace._begin()
+        if SDConfig.metrics and self.metric_name is not None:
+            self._rss_start = sd_metrics._rss_bytes()
+            self._traced_start = sd_metrics._traced_bytes()
         self.start_time = time.time()
+        self._perf_start = time.perf_counter()
 
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb) -> None:
-        self.contexts.pop()
+        self._record_metrics(error=exc_type is not None)
+        sd_trace._end(self.main_msg, self._trace_start, error=exc_type is not None)
+        try:
+            _contexts.reset(self._contexts_token)
+        except ValueError:
+            # Exited in another context than it was entered in, e.g. an async generator
+            _contexts.set(tuple(c for c in _contexts.get() if c is not self))
         buffer_str = self._context_buffer_str()
 
         if self.timer:
@@ -102,8 +149,6 @@ class SDLog:
 
         if self.slack:
             if SDConfig.slack_api_token is not None and len(SDConfig.slack_api_token) > 0:
-                slack_client = WebClient(SDConfig.slack_api_token)
-
                 # if isinstance(exc_type, KeyboardInterrupt):
                 #     return
 
@@ -124,10 +169,18 @@ class SDLog:
                                                    time.localtime(self.start_time)),
                                 exception=exc_type)
 
-                slack_client.chat_postMessage(
+                # Posted from a background thread, so a slow Slack API doesn't hold up the caller
+                _slack_queue.put(dict(
+                    token=SDConfig.slack_api_token,
+                    base_url=SDConfig.slack_base_url,
                     channel='#{channel}'.format(channel=SDConfig.slack_channel),
-                    text='{prefix} {msg}'.format(prefix=SDConfig.slack_personal_prefix, msg=msg),
-                    as_user=True)
+                    text='{prefix} {msg}'.format(prefix=SDConfig.slack_personal_prefix, msg=msg)))
+
+    async def __aenter__(self) -> 'SDLog':
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.__exit__(exc_type, exc_val, exc_tb)
 
     def log(self, *args, show_time: Optional[bool] = None) -> None:
         show_time = self.set_timer if show_time is None else show_time
@@ -173,7 +226,10 @@ class SDLog:
         """
         assert isinstance(message, str)
 
-        print(message)
+        if SDConfig.log_async:
+            _log_queue.put(message)
+        else:
+            print(message)
 
     @classmethod
     def log_func(cls, func: Optional[Callable] = None,
@@ -185,6 +241,23 @@ class SDLog:
             return functools.partial(cls.log_func, max_expected_time=max_expected_time)
 
         assert callable(func)
+        metric_name = '{}.{}'.format(func.__module__, func.__qualname__)
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs) -> Any:
+                if 'sdlog' in kwargs:
+                    sdlog = kwargs.pop('sdlog')
+                    assert isinstance(sdlog, bool)
+
+                    if not sdlog:
+                        return await func(*args, **kwargs)
+
+                with cls(func.__qualname__, max_expected_time=max_expected_time,
+                         metric_name=metric_name):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
 
         @functools.wraps(func)
         def wrapper(*args, **kwargs) -> Callable[[Any], Any]:
@@ -195,12 +268,30 @@ class SDLog:
                 if not sdlog:
                     return func(*args, **kwargs)
 
-            with cls(func.__qualname__, max_expected_time=max_expected_time):
+            with cls(func.__qualname__, max_expected_time=max_expected_time,
+                     metric_name=metric_name):
                 return func(*args, **kwargs)
 
         return wrapper
 
+    @classmethod
+    def current_contexts(cls) -> Tuple['SDLog', ...]:
+        """SDLog contexts entered in the current thread or asyncio task, outermost first"""
+        return _contexts.get()
+
     # /// Internal only /// #
+    def _record_metrics(self, error: bool) -> None:
+        if not SDConfig.metrics or self.metric_name is None or self._perf_start is None:
+            return
+
+        rss, traced = sd_metrics._rss_bytes(), sd_metrics._traced_bytes()
+        sd_metrics._record(
+            self.metric_name, time.perf_counter() - self._perf_start,
+            rss_delta=None if rss is None or self._rss_start is None else rss - self._rss_start,
+            alloc_delta=None if traced is None or self._traced_start is None
+            else traced - self._traced_start,
+            error=error)
+
     @property
     def time_diff(self) -> float:
         return time.time() - self.start_time
@@ -218,7 +309,7 @@ class SDLog:
 
     @classmethod
     def _context_buffer_str(cls) -> str:
-        num_contexts = len(cls.contexts)
+        num_contexts = len(_contexts.get())
 
         group_str = cls.special_char * 3 + cls.break_char
         return str(group_str * (num_contexts // 4) + cls.special_char * (num_contexts % 4))
@@ -232,7 +323,7 @@ def log_func(func: Optional[Callable] = None,
              max_expected_time: Optional[Union[int, float]] = None) -> Callable[[Any], Any]:
     """
     Decorator which optionally takes max_expected_time, a number of seconds that a function may take
-    to execute before a SLOW FUNCTION message is logged
+    to execute before a SLOW FUNCTION message is logged. Works on functions and coroutine functions
 
     Parameters
     ----------
@@ -246,33 +337,146 @@ def log_func(func: Optional[Callable] = None,
     callable
         Wrapped function
     """
-    # If max_expected_time was passed in, then func will be none and we have to return
-    # log_func as a partial function with max_expected_time already filled in, to be used as
-    # the decorator again
-    if func is None:
-        return functools.partial(log_func, max_expected_time=max_expected_time)
+    return SDLog.log_func(func, max_expected_time=max_expected_time)
+
+
+def log_gen(obj: Any, msg: str) -> Any:
+    assert isinstance(msg, str)
+    log(msg)
+    return obj
 
-    assert callable(func)
 
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs) -> Callable[[Any], Any]:
-        if 'sdlog' in kwargs:
-            sdlog = kwargs.pop('sdlog')
-            assert isinstance(sdlog, bool)
+def flush_logs(timeout: Optional[float] = None) -> bool:
+    """
+    Waits for the log messages (with SDConfig.log_async) and Slack notifications queued so far
+    to be written and sent
 
-            if not sdlog:
-                return func(*args, **kwargs)
+    Parameters
+    ----------
+    timeout: float
+        Maximum number of seconds to wait, or None to wait until they're done
 
-        with SDLog(func.__qualname__, max_expected_time=max_expected_time):
-            return func(*args, **kwargs)
+    Returns
+    -------
+    bool
+        True if everything was flushed, False on timeout
+    """
+    assert timeout is None or isinstance(timeout, (int, float))
 
-    return wrapper
+    deadline = None if timeout is None else time.monotonic() + timeout
+    return all(background_queue.flush(None if deadline is None
+                                      else max(deadline - time.monotonic(), 0))
+               for background_queue in (_log_queue, _slack_queue))
 
 
-def log_gen(obj: Any, msg: str) -> Any:
-    assert isinstance(msg, str)
-    log(msg)
-    return obj
+# /// Internal only /// #
+class _BackgroundQueue:
+    def __init__(self, handle_batch: Callable[[List[Any]], None], name: str,
+                 max_batch: int = 1000) -> None:
+        """
+        Items put on a queue and handled in batches by a daemon thread, started on first use
+
+        Parameters
+        ----------
+        handle_batch: callable
+            Called on the background thread with a list of the queued items, oldest first
+        name: str
+            Name of the background thread
+        max_batch: int
+            Maximum number of items per call of handle_batch
+        """
+        self._handle_batch = handle_batch
+        self._name = name
+        self._max_batch = max_batch
+        self._reset()
+
+        # A forked child gets a copy of the queue but not the thread, so it starts afresh
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def put(self, item: Any) -> None:
+        with self._condition:
+            self._pending += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+                self._thread.start()
+        self._queue.put(item)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Waits for the items put so far to be handled, returning False on timeout"""
+        with self._condition:
+            return self._condition.wait_for(lambda: self._pending == 0, timeout)
+
+    def _reset(self) -> None:
+        self._queue = queue.Queue()  # type: queue.Queue
+        self._condition = threading.Condition()
+        self._pending = 0
+        self._thread = None  # type: Optional[threading.Thread]
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self._max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                self._handle_batch(batch)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                with self._condition:
+                    self._pending -= len(batch)
+                    self._condition.notify_all()
+
+
+def _print_messages(messages: List[str]) -> None:
+    print('\n'.join(messages), flush=True)
+
+
+# Number of retries of failed Slack posts, and the delay before the first, doubled every retry
+_SLACK_RETRIES = 3
+_SLACK_RETRY_DELAY = 1.
+# WebClients by token and base URL, reused across notifications. Only used by the Slack thread
+_slack_clients = {}  # type: Dict[Tuple[str, Optional[str]], WebClient]
+
+
+def _post_slack_messages(messages: List[dict]) -> None:
+    for message in messages:
+        key = (message['token'], message['base_url'])
+        if key not in _slack_clients:
+            _slack_clients[key] = WebClient(message['token']) if message['base_url'] is None \
+                else WebClient(message['token'], base_url=message['base_url'])
+
+        for attempt in range(_SLACK_RETRIES + 1):
+            try:
+                _slack_clients[key].chat_postMessage(
+                    channel=message['channel'], text=message['text'], as_user=True)
+                break
+            except Exception as e:
+                if attempt == _SLACK_RETRIES:
+                    print('Slack notification failed after {} attempts: {}'.format(
+                        attempt + 1, e), flush=True)
+                    break
+
+                # Rate-limited responses say how long to wait
+                headers = getattr(getattr(e, 'response', None), 'headers', None) or {}
+                try:
+                    delay = float(headers.get('Retry-After', ''))
+                except ValueError:
+                    delay = _SLACK_RETRY_DELAY * 2 ** attempt
+                time.sleep(delay)
+
+
+_log_queue = _BackgroundQueue(_print_messages, name='sd_log')
+_slack_queue = _BackgroundQueue(_post_slack_messages, name='sd_log_slack', max_batch=100)
+
+
+@atexit.register
+def _flush_logs_at_exit() -> None:
+    flush_logs(timeout=60)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,174 @@
+"""
+StratoDem Analytics : sd_metrics
+Principal Author(s) : Michael Clawar
+Secondary Author(s) :
+Description : In-process registry of the durations and memory use of SDLog contexts
+
+Notes :
+Every log_func call is recorded under the module and qualname of the function, and SDLog
+contexts given a metric_name under it. Other SDLog contexts aren't recorded, so the registry
+doesn't grow with every distinct message. Allocation deltas are only recorded while tracemalloc
+is tracing.
+
+October 18, 2026
+"""
+
+import json
+import math
+import os
+import random
+import threading
+import tracemalloc
+from typing import Dict, Optional
+
+from sd_utils.sd_config import SDConfig
+
+
+__all__ = [
+    'get_metrics',
+    'metrics_json',
+    'metrics_prometheus',
+    'reset_metrics',
+]
+
+
+# Durations kept per name for percentiles, as a uniform sample of all calls
+_SAMPLE_SIZE = 1024
+_QUANTILES = (0.5, 0.95, 0.99)
+
+
+class _FunctionMetrics:
+    def __init__(self) -> None:
+        self.count = 0
+        self.errors = 0
+        self.total = 0.
+        self.min = math.inf
+        self.max = 0.
+        self.rss_delta = 0
+        self.alloc_delta = 0
+        self.samples = []
+
+    def add(self, duration: float, rss_delta: Optional[int], alloc_delta: Optional[int],
+            error: bool) -> None:
+        self.count += 1
+        self.errors += int(error)
+        self.total += duration
+        self.min = min(self.min, duration)
+        self.max = max(self.max, duration)
+        self.rss_delta += rss_delta or 0
+        self.alloc_delta += alloc_delta or 0
+
+        # Reservoir sampling
+        if len(self.samples) < _SAMPLE_SIZE:
+            self.samples.append(duration)
+        else:
+            position = random.randrange(self.count)
+            if position < _SAMPLE_SIZE:
+                self.samples[position] = duration
+
+    def to_dict(self) -> dict:
+        samples = sorted(self.samples)
+        return dict(
+            count=self.count,
+            errors=self.errors,
+            total_seconds=self.total,
+            mean_seconds=self.total / self.count,
+            min_seconds=self.min,
+            max_seconds=self.max,
+            **{'p{:g}_seconds'.format(q * 100): samples[max(math.ceil(q * len(samples)) - 1, 0)]
+               for q in _QUANTILES},
+            rss_delta_bytes=self.rss_delta,
+            alloc_delta_bytes=self.alloc_delta)
+
+
+_metrics = {}  # type: Dict[str, _FunctionMetrics]
+_lock = threading.Lock()
+
+
+def get_metrics() -> Dict[str, dict]:
+    """
+    Metrics of every recorded name: count, errors, total/mean/min/max and p50/p95/p99
+    durations in seconds, and the summed RSS and traced allocation deltas in bytes
+    """
+    with _lock:
+        return {name: metrics.to_dict() for name, metrics in sorted(_metrics.items())}
+
+
+def metrics_json(**json_kwargs) -> str:
+    """get_metrics as a JSON object, with json_kwargs passed to json.dumps"""
+    return json.dumps(get_metrics(), **json_kwargs)
+
+
+def metrics_prometheus(prefix: str = 'sd_utils') -> str:
+    """get_metrics in the Prometheus text exposition format, labeled by name"""
+    assert isinstance(prefix, str)
+
+    metrics = get_metrics()
+    lines = [
+        '# HELP {}_duration_seconds Duration of SDLog contexts'.format(prefix),
+        '# TYPE {}_duration_seconds summary'.format(prefix),
+    ]
+    for name, values in metrics.items():
+        label = _prometheus_label(name)
+        for q in _QUANTILES:
+            lines.append('{}_duration_seconds{{name="{}",quantile="{:g}"}} {!r}'.format(
+                prefix, label, q, values['p{:g}_seconds'.format(q * 100)]))
+        lines.append('{}_duration_seconds_sum{{name="{}"}} {!r}'.format(
+            prefix, label, values['total_seconds']))
+        lines.append('{}_duration_seconds_count{{name="{}"}} {}'.format(
+            prefix, label, values['count']))
+
+    for metric, key, metric_type, description in [
+            ('errors_total', 'errors', 'counter', 'SDLog contexts exited with an exception'),
+            ('rss_delta_bytes', 'rss_delta_bytes', 'gauge',
+             'Summed change of resident memory over SDLog contexts'),
+            ('alloc_delta_bytes', 'alloc_delta_bytes', 'gauge',
+             'Summed change of memory traced by tracemalloc over SDLog contexts')]:
+        lines.append('# HELP {}_{} {}'.format(prefix, metric, description))
+        lines.append('# TYPE {}_{} {}'.format(prefix, metric, metric_type))
+        for name, values in metrics.items():
+            lines.append('{}_{}{{name="{}"}} {}'.format(
+                prefix, metric, _prometheus_label(name), values[key]))
+
+    return '\n'.join(lines) + '\n'
+
+
+def reset_metrics() -> None:
+    with _lock:
+        _metrics.clear()
+
+
+# /// Internal only /// #
+def _record(name: str, duration: float, rss_delta: Optional[int] = None,
+            alloc_delta: Optional[int] = None, error: bool = False) -> None:
+    if not SDConfig.metrics:
+        return
+
+    with _lock:
+        if name not in _metrics:
+            _metrics[name] = _FunctionMetrics()
+        _metrics[name].add(duration, rss_delta, alloc_delta, error)
+
+
+def _rss_bytes() -> Optional[int]:
+    """Resident memory of this process, or None where /proc isn't available"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _traced_bytes() -> Optional[int]:
+    """Memory allocated as traced by tracemalloc, or None if it isn't tracing"""
+    return tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+
+
+def _prometheus_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+try:
+    _PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, OSError, ValueError):
+    _PAGE_SIZE = 4096
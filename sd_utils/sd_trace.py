@@ -0,0 +1,180 @@
+"""
+StratoDem Analytics : sd_trace
+Principal Author(s) : Michael Clawar
+Secondary Author(s) :
+Description : Chrome trace export of nested SDLog contexts
+
+Notes :
+While tracing, every SDLog context and log_func call adds a complete event (its start and
+duration) with its process and thread when it exits. Unlike begin/end pairs, these stay correct
+for coroutines interleaving on one thread. Multi-file readers running on worker processes send
+the events of the workers back with their results, so they are merged into one timeline. Traces
+open in chrome://tracing, Perfetto or speedscope.
+
+October 18, 2026
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+
+
+__all__ = [
+    'start_tracing',
+    'stop_tracing',
+    'is_tracing',
+    'trace_events',
+    'write_trace',
+    'tracing',
+]
+
+
+_lock = threading.Lock()
+_active = False
+_events = []  # type: List[dict]
+# (pid, tid) pairs whose thread name was already added to _events
+_named_threads = set()
+
+
+def start_tracing() -> None:
+    """Starts recording SDLog contexts, discarding any events recorded before"""
+    global _active
+
+    with _lock:
+        _events.clear()
+        _named_threads.clear()
+        _active = True
+
+
+def stop_tracing() -> List[dict]:
+    """Stops recording and returns the events recorded"""
+    global _active
+
+    with _lock:
+        _active = False
+        return list(_events)
+
+
+def is_tracing() -> bool:
+    return _active
+
+
+def trace_events() -> List[dict]:
+    """Events recorded so far, in the Chrome trace event format"""
+    with _lock:
+        return list(_events)
+
+
+def write_trace(file_path: str, events: Optional[List[dict]] = None) -> None:
+    """
+    Writes events (by default the ones recorded so far) to file_path as a Chrome trace JSON file
+
+    Parameters
+    ----------
+    file_path: str
+    events: list
+        Events returned by stop_tracing or trace_events
+    """
+    assert isinstance(file_path, str)
+    assert events is None or isinstance(events, list)
+
+    with open(file_path, 'w') as f:
+        json.dump({'traceEvents': trace_events() if events is None else events,
+                   'displayTimeUnit': 'ms'}, f)
+
+
+@contextlib.contextmanager
+def tracing(file_path: Optional[str] = None) -> Iterator[None]:
+    """
+    Context manager tracing the SDLog contexts inside it, written to file_path (if given) on exit
+
+    Parameters
+    ----------
+    file_path: str
+        Path of the Chrome trace JSON file to write
+    """
+    assert file_path is None or isinstance(file_path, str)
+
+    start_tracing()
+    try:
+        yield
+    finally:
+        events = stop_tracing()
+        if file_path is not None:
+            write_trace(file_path, events)
+
+
+# /// Internal only /// #
+def _begin() -> Optional[int]:
+    """Start of a span to pass to _end, or None if not tracing"""
+    return _now() if _active else None
+
+
+def _end(name: str, start: Optional[int], error: bool = False) -> None:
+    """Adds the complete event of a span started by _begin"""
+    if not _active or start is None:
+        return
+
+    event = {'name': name, 'cat': 'sd_log', 'ph': 'X', 'ts': start, 'dur': _now() - start,
+             'pid': os.getpid(), 'tid': threading.get_ident()}
+    if error:
+        event['args'] = {'error': True}
+
+    with _lock:
+        if (event['pid'], event['tid']) not in _named_threads:
+            _named_threads.add((event['pid'], event['tid']))
+            _events.append({'name': 'thread_name', 'ph': 'M', 'pid': event['pid'],
+                            'tid': event['tid'],
+                            'args': {'name': threading.current_thread().name}})
+        _events.append(event)
+
+
+def _now() -> int:
+    """Microseconds since the epoch, so events of every process share one clock"""
+    return time.time_ns() // 1000
+
+
+def _merge(events: List[dict]) -> None:
+    """Adds events recorded in a worker process"""
+    with _lock:
+        for event in events:
+            if event['ph'] == 'M':
+                if (event['pid'], event['tid']) in _named_threads:
+                    continue
+                _named_threads.add((event['pid'], event['tid']))
+            _events.append(event)
+
+
+def _call_traced(item: Any, func: Callable) -> Tuple[Any, List[dict]]:
+    """
+    Calls func(item) in a worker process with tracing on, returning its result and the events
+    recorded during the call. If it runs in the tracing process itself (e.g. joblib with one
+    worker or a threading backend), the events are recorded in place and none are returned, so
+    the trace in progress isn't reset
+    """
+    if _active:
+        return func(item), []
+
+    start_tracing()
+    try:
+        result = func(item)
+    finally:
+        events = stop_tracing()
+    return result, events
+
+
+def _reset_after_fork() -> None:
+    """A forked child doesn't trace until asked to, and doesn't keep the parent's events"""
+    global _active, _lock
+
+    _lock = threading.Lock()
+    _active = False
+    _events.clear()
+    _named_threads.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -11,36 +11,406 @@ January 12, 2017
 StratoDem Analytics, LLC
 """
 
-from typing import List, Union
+import collections
+import hashlib
+import threading
+import weakref
+from typing import List, Optional, Tuple, Union
 
 import numpy as np
 import pandas
 import xarray
 
 
-__all__ = ['df_to_xds', 'ds_to_xda', 'make_gather_map']
+__all__ = ['df_to_xds', 'ds_to_xda', 'estimate_dense_nbytes', 'make_gather_map', 'GatherMap']
 
 
-def df_to_xds(df: pandas.DataFrame) -> xarray.Dataset:
+def df_to_xds(df: pandas.DataFrame, *, sparse: bool = False, chunks: Optional[int] = None,
+              max_dense_bytes: Optional[int] = None) -> xarray.Dataset:
+    """
+    Dataset with one dimension per index level of df and one variable per column
+
+    Parameters
+    ----------
+    df: pandas.DataFrame
+    sparse: bool
+        Back the variables with sparse.COO arrays (needs the sparse package), so only the rows
+        of df are stored instead of the Cartesian product of the index levels
+    chunks: int
+        Back the variables with dask arrays with this many labels of the first index level per
+        chunk. Each chunk is filled from the rows of df when computed, so the full dense array
+        is never built
+    max_dense_bytes: int
+        Raise a ValueError instead of building dense numpy variables larger than this in total,
+        see estimate_dense_nbytes
+    """
     assert isinstance(df, pandas.DataFrame)
-    return xarray.Dataset.from_dataframe(df)
+    assert isinstance(sparse, bool)
+    assert chunks is None or (isinstance(chunks, int) and chunks > 0)
+    assert max_dense_bytes is None or isinstance(max_dense_bytes, int)
+    assert not (sparse and chunks is not None), 'Use either sparse or chunks'
+
+    if chunks is not None:
+        dims, coords, data_vars = _df_to_dask_arrays(df, chunks)
+        return xarray.Dataset({column: (dims, data) for column, data in data_vars.items()},
+                              coords=coords)
+    if not sparse:
+        _check_dense_nbytes(df, max_dense_bytes)
+
+    return xarray.Dataset.from_dataframe(df, sparse=sparse)
 
 
-def ds_to_xda(ds: pandas.Series) -> xarray.DataArray:
+def ds_to_xda(ds: pandas.Series, *, sparse: bool = False, chunks: Optional[int] = None,
+              max_dense_bytes: Optional[int] = None) -> xarray.DataArray:
+    """
+    DataArray with one dimension per index level of ds, with the same options as df_to_xds
+    """
     assert isinstance(ds, pandas.Series)
-    return xarray.DataArray.from_series(ds)
+    assert isinstance(sparse, bool)
+    assert chunks is None or (isinstance(chunks, int) and chunks > 0)
+    assert max_dense_bytes is None or isinstance(max_dense_bytes, int)
+    assert not (sparse and chunks is not None), 'Use either sparse or chunks'
+
+    if chunks is not None:
+        dims, coords, data_vars = _df_to_dask_arrays(ds.to_frame(name=0), chunks)
+        return xarray.DataArray(data_vars[0], dims=dims, coords=coords, name=ds.name)
+    if not sparse:
+        _check_dense_nbytes(ds.to_frame(), max_dense_bytes)
+
+    return xarray.DataArray.from_series(ds, sparse=sparse)
+
+
+def estimate_dense_nbytes(df: Union[pandas.DataFrame, pandas.Series]) -> int:
+    """
+    Bytes of the dense numpy arrays df_to_xds (or ds_to_xda) would build from df, without
+    building them: the product of the index level sizes times the item size of each column,
+    after the promotion needed to hold missing values if df doesn't fill every cell
+    """
+    assert isinstance(df, (pandas.DataFrame, pandas.Series))
+    if isinstance(df, pandas.Series):
+        df = df.to_frame()
+
+    levels, _ = _index_levels_codes(df.index)
+    n_cells = int(np.prod([len(level) for level in levels], dtype=np.float64))
+    dense = n_cells == len(df)
+
+    return n_cells * sum(
+        (dtype if dense else _missing_dtype_fill(dtype)[0]).itemsize
+        for dtype in _column_dtypes(df))
 
 
 def make_gather_map(xda_reference: xarray.DataArray,
-                    gather_values: Union[xarray.DataArray, np.ndarray, List]) -> List[int]:
-    assert isinstance(xda_reference, xarray.DataArray)
+                    gather_values: Union[xarray.DataArray, np.ndarray, List], *,
+                    missing: str = 'raise', sentinel: int = -1) -> np.ndarray:
+    """
+    Positions in xda_reference of each of gather_values, e.g. to use with .isel
+
+    Parameters
+    ----------
+    xda_reference: xarray.DataArray
+        Values to look up. If a value appears more than once its last position is used
+    gather_values: xarray.DataArray, numpy.ndarray or list
+        Values to find in xda_reference
+    missing: str
+        What to do with gather_values that aren't in xda_reference
+            'raise': raise a KeyError
+            'sentinel': use sentinel as their position
+            'mask': return a numpy masked array with their positions masked
+    sentinel: int
+        Position used for missing values with missing='sentinel'
 
-    g5_to_idx = {g5: idx for idx, g5 in enumerate(xda_reference.values)}
+    Returns
+    -------
+    numpy.ndarray
+        intp array of positions, the same length as gather_values
+    """
+    assert isinstance(xda_reference, xarray.DataArray)
+    assert missing in ('raise', 'sentinel', 'mask')
+    assert isinstance(sentinel, int)
 
     if isinstance(gather_values, xarray.DataArray):
-        return [g5_to_idx[g5_to] for g5_to in gather_values.values]
+        gather_values = gather_values.values
     elif isinstance(gather_values, (np.ndarray, list)):
-        # noinspection PyTypeChecker
-        return [g5_to_idx[g5_to] for g5_to in gather_values]
+        gather_values = np.asarray(gather_values)
     else:
         raise TypeError
+
+    reference_index, positions = _reference_index(xda_reference)
+    indexer = reference_index.get_indexer(gather_values).astype(np.intp, copy=False)
+    found = indexer >= 0
+    if positions is not None:
+        indexer = np.where(found, positions.take(indexer), -1)
+
+    if found.all():
+        return indexer
+    if missing == 'raise':
+        raise KeyError(gather_values[~found][0])
+    if missing == 'mask':
+        return np.ma.masked_array(indexer, mask=~found)
+
+    indexer[~found] = sentinel
+    return indexer
+
+
+class GatherMap:
+    def __init__(self, xda_reference: xarray.DataArray,
+                 gather_values: Union[xarray.DataArray, np.ndarray, List], *,
+                 target_dim: Optional[str] = None, missing: str = 'raise') -> None:
+        """
+        Gather/scatter operator between a reference coordinate and a target coordinate, built
+        once from make_gather_map and applied to whole Datasets or DataArrays in one pass.
+        Both operations work on dask-backed objects chunk by chunk.
+
+        Parameters
+        ----------
+        xda_reference: xarray.DataArray
+            1-D reference coordinate, e.g. the G5 coordinate of the source data
+        gather_values: xarray.DataArray, numpy.ndarray or list
+            Reference value of each element of the target coordinate
+        target_dim: str
+            Name of the target dimension. Defaults to the dimension of gather_values if it is a
+            DataArray, otherwise the dimension of xda_reference
+        missing: str
+            'raise' a KeyError for gather_values not in xda_reference, or 'ignore' them: they
+            gather NaN and are left out of scatter_add
+        """
+        assert isinstance(xda_reference, xarray.DataArray) and xda_reference.ndim == 1
+        assert target_dim is None or isinstance(target_dim, str)
+        assert missing in ('raise', 'ignore')
+
+        if target_dim is None:
+            target_dim = gather_values.dims[0] if isinstance(gather_values, xarray.DataArray) \
+                else xda_reference.dims[0]
+
+        self.dim = xda_reference.dims[0]
+        self.target_dim = target_dim
+        self.reference_values = xda_reference.values
+        self.target_values = gather_values.values \
+            if isinstance(gather_values, xarray.DataArray) else np.asarray(gather_values)
+        self.indexer = make_gather_map(
+            xda_reference, gather_values, missing='raise' if missing == 'raise' else 'sentinel')
+        self.found = self.indexer >= 0
+
+    def gather(self, obj: Union[xarray.Dataset, xarray.DataArray]) \
+            -> Union[xarray.Dataset, xarray.DataArray]:
+        """
+        Takes the reference element of every target element from each variable along dim, so the
+        result is along target_dim. Variables without dim are unchanged
+        """
+        assert isinstance(obj, (xarray.Dataset, xarray.DataArray))
+        assert self.dim in obj.dims
+
+        indexer = xarray.DataArray(np.where(self.found, self.indexer, 0), dims=self.target_dim)
+        result = obj.isel({self.dim: indexer})
+        if not self.found.all():
+            result = result.where(xarray.DataArray(self.found, dims=self.target_dim))
+
+        return result.assign_coords({self.target_dim: self.target_values})
+
+    def scatter_add(self, obj: Union[xarray.Dataset, xarray.DataArray]) \
+            -> Union[xarray.Dataset, xarray.DataArray]:
+        """
+        Adjoint of gather: sums each variable along target_dim into the reference elements, so
+        the result is along dim. Variables without target_dim are unchanged
+        """
+        assert isinstance(obj, (xarray.Dataset, xarray.DataArray))
+        assert self.target_dim in obj.dims
+
+        if isinstance(obj, xarray.DataArray):
+            return self._scatter_add_xda(obj)
+
+        return obj.drop_vars([name for name, coord in obj.coords.items()
+                              if self.target_dim in coord.dims]) \
+            .drop_dims(self.target_dim) \
+            .assign({name: self._scatter_add_xda(xda) for name, xda in obj.data_vars.items()
+                     if self.target_dim in xda.dims})
+
+    # /// Internal only /// #
+    def _scatter_add_xda(self, xda: xarray.DataArray) -> xarray.DataArray:
+        dtype = np.dtype(np.int64) if xda.dtype == bool else xda.dtype
+
+        result = xarray.apply_ufunc(
+            _scatter_add_last_axis, xda,
+            input_core_dims=[[self.target_dim]],
+            output_core_dims=[[self.dim]],
+            # Without a target_dim, the target elements are along dim too but sized differently
+            exclude_dims={self.dim} if self.dim == self.target_dim else set(),
+            kwargs=dict(indexer=self.indexer[self.found], found=self.found,
+                        size=len(self.reference_values), dtype=dtype),
+            dask='parallelized',
+            output_dtypes=[dtype],
+            dask_gufunc_kwargs={'output_sizes': {self.dim: len(self.reference_values)},
+                                'allow_rechunk': True})
+
+        return result.assign_coords({self.dim: self.reference_values})
+
+
+# /// Internal only /// #
+def _check_dense_nbytes(df: pandas.DataFrame, max_dense_bytes: Optional[int]) -> None:
+    if max_dense_bytes is None:
+        return
+
+    nbytes = estimate_dense_nbytes(df)
+    if nbytes > max_dense_bytes:
+        raise ValueError(
+            'Dense conversion needs about {:,} bytes, more than max_dense_bytes={:,}. '
+            'Use sparse=True or chunks=... instead'.format(nbytes, max_dense_bytes))
+
+
+def _column_dtypes(df: pandas.DataFrame) -> List[np.dtype]:
+    """numpy dtypes the columns of df have once converted, e.g. object for categoricals"""
+    return [dtype if isinstance(dtype, np.dtype) else np.dtype(object) for dtype in df.dtypes]
+
+
+def _missing_dtype_fill(dtype: np.dtype) -> Tuple[np.dtype, object]:
+    """dtype able to hold missing values of dtype, and the missing value to fill with"""
+    if dtype.kind in 'mM':
+        return dtype, dtype.type('NaT')
+    if dtype.kind in 'fc':
+        return dtype, np.nan
+    if dtype.kind in 'iu':
+        return np.dtype(np.float64), np.nan
+    return np.dtype(object), np.nan
+
+
+def _index_levels_codes(index: pandas.Index) -> Tuple[List[pandas.Index], List[np.ndarray]]:
+    """Labels of each dimension built from index, and the position of each row in them"""
+    if isinstance(index, pandas.MultiIndex):
+        index = index.remove_unused_levels()
+        return list(index.levels), [np.asarray(codes) for codes in index.codes]
+
+    return [index], [np.arange(len(index))]
+
+
+def _df_to_dask_arrays(df: pandas.DataFrame, chunks: int) \
+        -> Tuple[Tuple[str, ...], dict, dict]:
+    """Dimensions, coordinates and a dask array per column for df_to_xds(..., chunks=...)"""
+    import dask
+    import dask.array
+
+    if not df.index.is_unique:
+        raise ValueError('cannot convert a DataFrame with a non-unique MultiIndex into xarray')
+
+    levels, codes = _index_levels_codes(df.index)
+    if isinstance(df.index, pandas.MultiIndex):
+        dims = tuple(name if name is not None else 'level_{}'.format(n)
+                     for n, name in enumerate(df.index.names))
+    else:
+        dims = (df.index.name if df.index.name is not None else 'index',)
+    shape = tuple(len(level) for level in levels)
+    dense = int(np.prod(shape, dtype=np.float64)) == len(df)
+
+    # Rows sorted by their flat position, so each chunk of the first dimension is a
+    # contiguous run of rows
+    flat = np.ravel_multi_index(codes, shape) if len(df) else np.array([], dtype=np.intp)
+    order = np.argsort(flat, kind='stable')
+    flat = flat[order]
+    inner_size = int(np.prod(shape[1:], dtype=np.int64))
+    chunk_starts = list(range(0, shape[0], chunks))
+    chunk_stops = chunk_starts[1:] + [shape[0]]
+    row_bounds = np.searchsorted(flat, [start * inner_size for start in chunk_starts] +
+                                 [shape[0] * inner_size])
+
+    data_vars = {}
+    for column, dtype in zip(df.columns, _column_dtypes(df)):
+        fill_dtype, fill_value = (dtype, None) if dense else _missing_dtype_fill(dtype)
+        values = np.asarray(df[column].to_numpy(), dtype=dtype)[order]
+
+        blocks = []
+        for n, (start, stop) in enumerate(zip(chunk_starts, chunk_stops)):
+            block_shape = (stop - start,) + shape[1:]
+            rows = slice(row_bounds[n], row_bounds[n + 1])
+            blocks.append(dask.array.from_delayed(
+                dask.delayed(_dense_block, pure=True)(
+                    values[rows], flat[rows] - start * inner_size, block_shape, fill_dtype,
+                    fill_value),
+                shape=block_shape, dtype=fill_dtype))
+        data_vars[column] = dask.array.concatenate(blocks, axis=0) if blocks \
+            else dask.array.empty(shape, dtype=fill_dtype)
+
+    return dims, dict(zip(dims, levels)), data_vars
+
+
+def _dense_block(values: np.ndarray, flat: np.ndarray, shape: Tuple[int, ...],
+                 dtype: np.dtype, fill_value) -> np.ndarray:
+    """Dense array of shape with values at the flat positions and fill_value elsewhere"""
+    block = np.empty(int(np.prod(shape, dtype=np.int64)), dtype=dtype)
+    if len(flat) < len(block):
+        block.fill(fill_value)
+    block[flat] = values
+
+    return block.reshape(shape)
+
+
+def _scatter_add_last_axis(values: np.ndarray, indexer: np.ndarray, found: np.ndarray,
+                           size: int, dtype: np.dtype) -> np.ndarray:
+    """Sums values[..., found] into size bins of the last axis given by indexer"""
+    values = values[..., found]
+    rows = int(np.prod(values.shape[:-1]))
+
+    if dtype.kind in 'iu':
+        # bincount sums in float64, which loses integers above 2 ** 53
+        sums = np.zeros((rows, size), dtype=dtype)
+        np.add.at(sums, (slice(None), indexer), values.reshape(rows, -1).astype(dtype, copy=False))
+        return sums.reshape(values.shape[:-1] + (size,))
+
+    # One bincount over all rows, with each row's bins offset by row * size
+    bins = (indexer[np.newaxis, :] + size * np.arange(rows)[:, np.newaxis]).ravel()
+    sums = np.bincount(bins, weights=values.reshape(rows, -1).ravel(), minlength=rows * size)
+
+    return sums.reshape(values.shape[:-1] + (size,)).astype(dtype, copy=False)
+
+
+# Lookup indexes of recent references, keyed on the dtype, shape and a digest of their values, so
+# an entry can't be returned for other values (e.g. after the reference was modified in place).
+# An entry is dropped once the array it was built from is collected
+_reference_index_cache = collections.OrderedDict()
+_reference_index_lock = threading.RLock()
+_REFERENCE_INDEX_CACHE_SIZE = 16
+
+
+def _reference_index(
+        xda_reference: xarray.DataArray) -> Tuple[pandas.Index, Optional[np.ndarray]]:
+    """
+    pandas.Index of the reference values with its hash table, and, if values repeat, the
+    position each unique value maps to (the last one, as with a dict). Object arrays, which can't
+    be digested much faster than the index is built, aren't cached
+    """
+    values = xda_reference.values
+    key = None
+    if values.dtype != object:
+        key = (values.dtype.str, values.shape,
+               hashlib.sha1(np.ascontiguousarray(values).view(np.uint8)).hexdigest())
+        with _reference_index_lock:
+            cached = _reference_index_cache.get(key)
+            if cached is not None:
+                _reference_index_cache.move_to_end(key)
+                return cached
+
+    reference_index = pandas.Index(values.ravel())
+    positions = None
+    if not reference_index.is_unique:
+        is_last = ~reference_index.duplicated(keep='last')
+        positions = np.flatnonzero(is_last)
+        reference_index = reference_index[is_last]
+    # Builds the hash table now so it is stored in the cache
+    reference_index.get_indexer(reference_index[:1])
+
+    if key is not None:
+        # Views (e.g. of a pandas index) are made on every access, so follow them to the array
+        # owning the memory
+        owner = values
+        while isinstance(owner.base, np.ndarray):
+            owner = owner.base
+        with _reference_index_lock:
+            _reference_index_cache[key] = (reference_index, positions)
+            while len(_reference_index_cache) > _REFERENCE_INDEX_CACHE_SIZE:
+                _reference_index_cache.popitem(last=False)
+        weakref.finalize(owner, _forget_reference_index, key)
+
+    return reference_index, positions
+
+
+def _forget_reference_index(key: tuple) -> None:
+    with _reference_index_lock:
+        _reference_index_cache.pop(key, None)